@@ -1,19 +1,122 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from direction import Direction
+import metrics
 import numpy as np
+import asyncio
 
 class Expert(ABC):
+
+    # Maximum number of waypoints (source and destination included) accepted by a single request
+    max_waypoints = 2
+    # Name of the coordinate arrays streamed straight into NumPy when compute_path is set (None to parse the whole body)
+    path_key = None
     
     @abstractmethod
     def __init__(self, key: str):
         pass
 
-    @abstractmethod
+    @property
+    def name(self):
+        # Name of the provider (e.g., "Here", "TomTom")
+        return type(self).__name__
+
     def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+              departure: Optional[str] = None, compute_path: Optional[bool] = False,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        # via is an optional (K,2) array of intermediate waypoints, visited in order
+        # simplify is applied to the parsed Direction (e.g., simplify.Simplifier("douglas_peucker", 10.0))
+        waypoints = self._waypoints(source, destination, via)
+        if waypoints.shape[0] > self.max_waypoints:
+            # Too many waypoints for one request: query the chunks concurrently, at most one per pooled connection
+            chunks = self._chunks(waypoints)
+            with ThreadPoolExecutor(max_workers=min(len(chunks), self.client.pool_size)) as executor:
+                directions = list(executor.map(lambda c: self.query(c[0], c[-1], departure, compute_path, c[1:-1]), chunks))
+            direction = Direction.join(directions)
+        else:
+            with metrics.timer("query", self.name):
+                with metrics.timer("build_request"):
+                    method, url, params, headers = self._build_request(waypoints, departure, compute_path)
+                response = self.client.request(method, url, params, headers, self.path_key if compute_path else None)
+                with metrics.timer("parse"):
+                    direction = self._parse_request(response, compute_path)
+
+        if simplify is not None and direction is not None:
+            with metrics.timer("simplify", self.name):
+                direction = simplify(direction)
+        return direction
+
+    async def aquery(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+                     departure: Optional[str] = None, compute_path: Optional[bool] = False, client=None,
+                     via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        # client is an AsyncClient, possibly shared by many experts; by default each expert owns one
+        if client is None:
+            client = self.aclient
+
+        waypoints = self._waypoints(source, destination, via)
+        if waypoints.shape[0] > self.max_waypoints:
+            directions = await asyncio.gather(*[self.aquery(c[0], c[-1], departure, compute_path, client, c[1:-1])
+                                                for c in self._chunks(waypoints)])
+            direction = Direction.join(list(directions))
+        else:
+            with metrics.timer("query", self.name):
+                with metrics.timer("build_request"):
+                    method, url, params, headers = self._build_request(waypoints, departure, compute_path)
+                # The asyncio and threaded queries of a provider share its limiter
+                response = await client.request(method, url, params, headers, self.path_key if compute_path else None,
+                                                getattr(self.client, "limiter", None))
+                with metrics.timer("parse"):
+                    direction = self._parse_request(response, compute_path)
+
+        if simplify is not None and direction is not None:
+            with metrics.timer("simplify", self.name):
+                direction = simplify(direction)
+        return direction
+
+    @property
+    def aclient(self):
+        if getattr(self, "_aclient", None) is None:
+            # aiohttp is only needed by the asyncio API
+            from aclient import AsyncClient
+            self._aclient = AsyncClient(base_url=self.base_url)
+        return self._aclient
+
+    @staticmethod
+    def _waypoints(source: np.ndarray, destination: np.ndarray, via: Optional[np.ndarray] = None):
+        # (N,2) array of [source, via0, via1, ..., destination]
+        if via is None:
+            via = np.empty((0, 2), dtype=float)
+        return np.vstack((np.asarray(source, dtype=float)[:2], np.asarray(via, dtype=float).reshape(-1, 2),
+                          np.asarray(destination, dtype=float)[:2]))
+
+    def _chunks(self, waypoints: np.ndarray):
+        # Split the waypoints into requests of at most max_waypoints that share their end points
+        step = self.max_waypoints - 1
+        return [waypoints[i:i + step + 1] for i in range(0, waypoints.shape[0] - 1, step)]
+
+    @abstractmethod
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        # waypoints is an (N,2) array of [lat, lng], from the source to the destination
+        # Return the (method, url, params, headers) of the request
         pass
 
     @staticmethod
     @abstractmethod
-    def _parse_request(response: dict):
-        pass
\ No newline at end of file
+    def _parse_request(response: dict, compute_path: bool):
+        pass
+
+    def close(self):
+        # Release the pooled connections of the client
+        self.client.close()
+
+    async def aclose(self):
+        if getattr(self, "_aclient", None) is not None:
+            await self._aclient.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
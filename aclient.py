@@ -0,0 +1,175 @@
+import aiohttp
+import asyncio
+import json
+import metrics
+import random
+import time
+import traceback
+from typing import Optional, Union
+from yarl import URL
+from client import Client, RETRY_STATUS, parse_retry_after
+from streamjson import PathStream
+
+class AsyncClient():
+
+    def __init__(self, base_url: Optional[str] = None, pool_size: int = 100,
+                 timeout: Optional[Union[float, tuple]] = (3.05, 27), keep_alive: bool = True, retries: int = 2,
+                 backoff: float = 0.5, max_backoff: float = 30.0, limiter=None):
+        # A single AsyncClient can be shared by all the experts, so that they use the same connection pool
+        self.base_url = base_url
+        # Maximum number of connections open at the same time
+        self.pool_size = pool_size
+        # (connect, read) timeouts in seconds
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+        # Retries as in Client, after connection errors, timeouts and RETRY_STATUS responses
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Default ratelimit.AdaptiveBucket, replaced by the limiter passed to request (the one of the provider,
+        # shared with its synchronous Client)
+        self.limiter = limiter
+
+        # The session is bound to the running event loop, so it is created on first use, and again when the client
+        # is used from another event loop (e.g., successive asyncio.run)
+        self._session = None
+        self._loop = None
+        self._lock = None
+        self._closer = None
+
+    @staticmethod
+    async def _close_on_cancel(session: aiohttp.ClientSession):
+        # Close the session when this task is cancelled, by close or by asyncio.run, which cancels the remaining
+        # tasks before closing its loop
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await session.close()
+
+    async def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The session of a previous loop is closed by that loop
+            self._loop = loop
+            self._session = None
+            self._closer = None
+            self._lock = asyncio.Lock()
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    if isinstance(self.timeout, tuple):
+                        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+                    else:
+                        timeout = aiohttp.ClientTimeout(total=self.timeout)
+                    connector = aiohttp.TCPConnector(limit=self.pool_size, force_close=not self.keep_alive)
+                    self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+                    if self._closer is not None:
+                        self._closer.cancel()
+                    self._closer = loop.create_task(self._close_on_cancel(self._session))
+        return self._session
+
+    def _backoff(self, attempt: int):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _request(self, session: aiohttp.ClientSession, method: str, url: str, limiter=None, **kwargs):
+        # Same retries and limiter feedback as Client._request
+        for attempt in range(self.retries + 1):
+            if limiter is not None and not await limiter.aacquire():
+                metrics.count("quota_exhausted")
+                raise RuntimeError("The daily quota of the provider is exhausted.")
+            start = time.perf_counter()
+            try:
+                response = await session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"), self.max_backoff)
+                if limiter is not None:
+                    if response.status == 429:
+                        metrics.count("throttled")
+                        limiter.throttled(retry_after)
+                    elif response.status < 500:
+                        limiter.succeeded(time.perf_counter() - start)
+                if response.status not in RETRY_STATUS or attempt == self.retries:
+                    return response
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                response.release()
+            metrics.count("retries")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _json(response: aiohttp.ClientResponse, stream_key: Optional[str] = None):
+        if stream_key is None:
+            body = await response.read()
+            metrics.count("received_bytes", len(body))
+            return json.loads(body)
+        # The coordinate arrays named stream_key are parsed while the body is downloaded
+        stream = PathStream(stream_key, response.content_length or 0)
+        async for chunk in response.content.iter_chunked(65536):
+            metrics.count("received_bytes", len(chunk))
+            stream.feed(chunk)
+        return stream.close()
+
+    async def request_get(self, base_url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                          limiter=None):
+        with metrics.timer("url"):
+            full_url = Client._generate_url(base_url, params)
+        try:
+            session = await self._get_session()
+            # The URL is already encoded; the network stage ends with the headers, the body is read while decoding
+            with metrics.timer("network"):
+                response = await self._request(session, "GET", URL(full_url, encoded=True), limiter or self.limiter,
+                                               headers=headers)
+            async with response:
+                with metrics.timer("decode"):
+                    return await self._json(response, stream_key)
+        except:
+            metrics.count("errors")
+            print(traceback.format_exc())
+            return None
+
+    async def request_post(self, full_url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                           limiter=None):
+        try:
+            session = await self._get_session()
+            limiter = limiter or self.limiter
+            with metrics.timer("network"):
+                if headers.get("Content-Type") == "application/json":
+                    response = await self._request(session, "POST", URL(full_url, encoded=True), limiter,
+                                                   headers=headers, json=params)
+                else:
+                    response = await self._request(session, "POST", URL(full_url, encoded=True), limiter,
+                                                   headers=headers, data=params)
+            async with response:
+                with metrics.timer("decode"):
+                    return await self._json(response, stream_key)
+        except:
+            metrics.count("errors")
+            print(traceback.format_exc())
+            return None
+
+    async def request(self, method: str, url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                      limiter=None):
+        # Send a request built by Expert._build_request; limiter paces it instead of the one of the client
+        if method == "GET":
+            return await self.request_get(base_url=url, params=params, headers=headers, stream_key=stream_key,
+                                          limiter=limiter)
+        else:
+            return await self.request_post(full_url=url, params=params, headers=headers, stream_key=stream_key,
+                                           limiter=limiter)
+
+    async def close(self):
+        if self._closer is not None and self._loop is asyncio.get_running_loop():
+            self._closer.cancel()
+            await asyncio.gather(self._closer, return_exceptions=True)
+        self._session = None
+        self._closer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -1,8 +1,8 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
 import numpy as np
 import json
@@ -13,28 +13,37 @@ class AppleMaps(Expert):
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://maps-api.apple.com/v1/directions"
-        self.client = Client(base_url=self.base_url)
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
 
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+        # The parameters that do not depend on the waypoints and departure are encoded once
+        self._template = encode_params(self._static_params())
+        self._headers = {"Content-Type": "application/json", "Authorization": "Bearer " + self.key}
+
+    @staticmethod
+    def _static_params():
         # For more information, visit https://developer.apple.com/documentation/applemapsserverapi/search_for_directions_and_estimated_travel_time_between_locations
-        key = self.key
 
         params = {}
-        params["origin"] = str(source[0])+","+str(source[1])
-        params["destination"] = str(destination[0])+","+str(destination[1])
         params["transportType"] = "Automobile"
 
+        return params
+
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        # Intermediate waypoints are not supported: Expert.query splits them into concurrent pairwise requests
+        points = waypoints.tolist()
+
+        query = "origin=" + QUERY_POINT % tuple(points[0]) + "&destination=" + QUERY_POINT % tuple(points[-1])
+
         if compute_path:
             # TODO
             pass
 
         if departure:
             # ISO 8601-format in UTC (e.g., 2023-04-15T16:42:00Z)
-            params["departureDate"] = departure
+            query += "&departureDate=" + quote_value(departure)
 
-        return self._parse_request(self.client.request_get(base_url=self.base_url, params=params,
-                                                      headers={"Content-Type": "application/json", "Authorization": "Bearer " + key}), compute_path)
+        return "GET", self.base_url, query + "&" + self._template, self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -45,15 +54,14 @@ class AppleMaps(Expert):
                 duration = duration + route["expectedTravelTimeSeconds"]
             
             if compute_path:
-                path = np.array([], dtype=str)
+                path = []
                 for leg in response["stepPaths"][0]:
                     for node in leg[0]:
                         lat = node["latitude"]
                         lng = node["longitude"]
-                        enc_node = fp.encode(np.array([lat, lng], dtype=float), 6, False)
-                        path = np.append(path, enc_node)
+                        path.append([lat, lng])
 
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, np.array(path, dtype=float))
             else:
                 return Direction(distance, duration)
         except:
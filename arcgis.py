@@ -1,29 +1,41 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _path(paths: list):
+    # paths is already an (N,2) array when the response was streamed
+    if isinstance(paths, np.ndarray):
+        points = paths
+    else:
+        points = np.concatenate([np.array(part, dtype=float).reshape(-1, 2) for part in paths])
+    # points is an array of [[lng1, lat1], [lng2, lat2], ...]
+    return points[:, ::-1]
+
 class ArcGIS(Expert):
 
+    max_waypoints = 150
+    path_key = "paths"
+
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://route.arcgis.com/arcgis/rest/services/World/Route/NAServer/Route_World/solve"
-        self.client = Client(base_url=self.base_url)
-    
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/json"}
+
+    def _static_params(self, compute_path: bool):
         # For more information, visit https://developers.arcgis.com/rest/network/api-reference/route-synchronous-service.htm
-        
-        # [lng, lat]-format
-        str_source = str(source[1])+","+str(source[0])
-        str_destination = str(destination[1])+","+str(destination[0])
+
         params = {}
-        params["stops"] = str_source+";"+str_destination
         params["token"] = self.key
         params["f"] = "json"
         params["impedanceAttributeName"] = "TravelTime"
@@ -38,12 +50,20 @@ class ArcGIS(Expert):
         else:
             params["outputLines"] = "esriNAOutputLineNone"
 
+        return params
+    
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        # [lng, lat]-format
+        query = "stops=" + "%3B".join(QUERY_POINT % (p[1], p[0]) for p in waypoints.tolist())
+        # The stops carry the cumulative distance and time used to split the route into legs
+        query += "&returnStops=true" if waypoints.shape[0] > 2 else "&returnStops=false"
+
         # UNIX-format (e.g., 1699599600)
         if departure:
-            params["startTime"] = departure
+            query += "&startTime=" + quote_value(departure)
 
-        return self._parse_request(self.client.request_get(base_url=self.base_url, params=params,
-                                                           headers={"Content-Type": "application/json"}), compute_path)
+        return "GET", self.base_url, query + "&" + self._templates[bool(compute_path)], self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -54,22 +74,70 @@ class ArcGIS(Expert):
             duration = response["routes"]["features"][0]["attributes"]["Total_TravelTime"]
             # From minutes to seconds
             duration = round(duration * 60)
+
+            leg_distances = leg_durations = None
+            if "stops" in response:
+                stops = sorted(response["stops"]["features"], key=lambda stop: stop["attributes"]["Sequence"])
+                leg_distances = np.round(np.diff([stop["attributes"]["Cumul_Kilometers"] for stop in stops]) * 1000)
+                leg_durations = np.round(np.diff([stop["attributes"]["Cumul_TravelTime"] for stop in stops]) * 60)
             
             if compute_path:
-                path = np.array([], dtype=str)
-                points = np.array(response["routes"]["features"][0]["geometry"]["paths"][0], dtype=float)
-                # points is an array of [[lng1, lat1], [lng2, lat2], ...]
-                
-                for p in points:
-                    lat = p[1]
-                    lng = p[0]
-                    enc_node = fp.encode(np.array([lat, lng], dtype=float), 6)
-                    path = np.append(path, enc_node)
+                # Decoded on the first access to the path
+                paths = response["routes"]["features"][0]["geometry"]["paths"]
             
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, paths, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
+        except:
+            Path("arcgis.json").write_text(json.dumps(response, indent=4, default=lambda array: array.tolist()))
+            print(traceback.format_exc())
+            return None
+
+class ArcGISMatrix(MatrixExpert):
+
+    # Direct requests
+    max_origins = 10
+    max_destinations = 10
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://route.arcgis.com/arcgis/rest/services/World/OriginDestinationCostMatrix/NAServer/OriginDestinationCostMatrix_World/solveODCostMatrix"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://developers.arcgis.com/rest/network/api-reference/origin-destination-cost-matrix-synchronous-service.htm
+
+        # [lng, lat]-format
+        params = {}
+        params["origins"] = ";".join(str(p[1])+","+str(p[0]) for p in sources)
+        params["destinations"] = ";".join(str(p[1])+","+str(p[0]) for p in destinations)
+        params["token"] = self.key
+        params["f"] = "json"
+        params["impedanceAttributeName"] = "TravelTime"
+        params["accumulateAttributeNames"] = "Kilometers,TravelTime"
+        params["outputType"] = "esriNAODOutputNoLines"
+
+        # UNIX-format (e.g., 1699599600)
+        if departure:
+            params["timeOfDay"] = departure
+
+        return "GET", self.base_url, params, {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _parse_request(response: dict, shape: tuple):
+        try:
+            distance = np.full(shape, np.nan, dtype=float)
+            duration = np.full(shape, np.nan, dtype=float)
+
+            # Origins and destinations are numbered from 1 in the order they were sent
+            for line in response["odLines"]["features"]:
+                attributes = line["attributes"]
+                # From Km to m and from minutes to seconds
+                distance[attributes["OriginID"] - 1, attributes["DestinationID"] - 1] = round(attributes["Total_Kilometers"] * 1000)
+                duration[attributes["OriginID"] - 1, attributes["DestinationID"] - 1] = round(attributes["Total_TravelTime"] * 60)
+
+            return distance, duration
         except:
-            Path("arcgis.json").write_text(json.dumps(response, indent=4))
+            Path("arcgis_matrix.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from abstract import Expert
+from ratelimit import TokenBucket
+import metrics
+import numpy as np
+
+class BatchResult(object):
+
+    __slots__ = ("distance", "duration", "mask", "directions")
+
+    def __init__(self, distance: np.ndarray, duration: np.ndarray, mask: np.ndarray,
+                 directions: Optional[np.ndarray] = None):
+        # Dense arrays of distances (m) and durations (s), NaN where the query failed
+        self.distance = distance
+        self.duration = duration
+        # True where the query failed
+        self.mask = mask
+        # Direction of every cell (None where the query failed), not available from matrix endpoints
+        self.directions = directions
+
+class Batch(object):
+
+    def __init__(self, expert: Expert, max_workers: int = 8, rate: Optional[float] = None,
+                 bucket: Optional[TokenBucket] = None, dedup: bool = True):
+        self.expert = expert
+        # Maximum number of requests in flight
+        self.max_workers = max_workers
+        # Whether identical pairs are queried only once
+        self.dedup = dedup
+        # Requests per second; by default the client of the expert paces the requests with the adaptive limiter
+        # of the provider (see ratelimit.limiter)
+        self.bucket = bucket if bucket is not None or rate is None else TokenBucket.for_provider(expert.name, rate)
+
+    def _query(self, source: np.ndarray, destination: np.ndarray, departure: Optional[str], compute_path: bool,
+               simplify: Optional[Callable] = None):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        try:
+            return self.expert.query(source, destination, departure, compute_path, simplify=simplify)
+        except Exception:
+            return None
+
+    def _run(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str], compute_path: bool,
+             simplify: Optional[Callable] = None):
+        # sources and destinations are (K,2) arrays of the pairs to query
+        inverse = None
+        if self.dedup and sources.shape[0] > 1:
+            pairs, inverse = np.unique(np.hstack((sources, destinations)), axis=0, return_inverse=True)
+            metrics.count("deduplicated", sources.shape[0] - pairs.shape[0], provider=self.expert.name)
+            sources, destinations = pairs[:, :2], pairs[:, 2:]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            directions = list(executor.map(lambda s, d: self._query(s, d, departure, compute_path, simplify),
+                                           sources, destinations))
+
+        cells = len(directions)
+        distance = np.full(cells, np.nan, dtype=float)
+        duration = np.full(cells, np.nan, dtype=float)
+        objects = np.empty(cells, dtype=object)
+        for i, direction in enumerate(directions):
+            if direction is not None:
+                distance[i] = direction.distance
+                duration[i] = direction.duration
+                objects[i] = direction
+
+        if inverse is not None:
+            # Back to the original pairs; duplicates share the same Direction
+            inverse = inverse.ravel()
+            distance, duration, objects = distance[inverse], duration[inverse], objects[inverse]
+
+        return BatchResult(distance, duration, np.isnan(distance), objects)
+
+    def query(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None,
+              compute_path: Optional[bool] = False, simplify: Optional[Callable] = None):
+        # Query the pairs (sources[i], destinations[i]) of two (N,2) arrays; the result has shape (N,)
+        # simplify is applied to the path of every Direction (see Expert.query)
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        if sources.shape != destinations.shape:
+            raise ValueError("sources and destinations must have the same shape.")
+
+        return self._run(sources, destinations, departure, compute_path, simplify)
+
+    def matrix(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None,
+               compute_path: Optional[bool] = False, simplify: Optional[Callable] = None):
+        # Query the cross product of an (M,2) and an (N,2) array; the result has shape (M,N)
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        m, n = sources.shape[0], destinations.shape[0]
+
+        result = self._run(np.repeat(sources, n, axis=0), np.tile(destinations, (m, 1)), departure, compute_path,
+                           simplify)
+
+        return BatchResult(result.distance.reshape(m, n), result.duration.reshape(m, n),
+                           result.mask.reshape(m, n), result.directions.reshape(m, n))
@@ -0,0 +1 @@
+# Offline benchmarks of OSPRA: run "python -m benchmarks" from the root of the repository
@@ -0,0 +1,30 @@
+from benchmarks.fixtures import PROVIDERS, SIZES
+from benchmarks import suite
+import argparse
+import json
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of OSPRA, results are printed as JSON.")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--providers", nargs="+", default=PROVIDERS, choices=PROVIDERS)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--groups", nargs="+", default=["flexpolyline", "parse", "request", "client", "query"],
+                        choices=["flexpolyline", "parse", "request", "client", "query"])
+    parser.add_argument("--repeat", type=int, default=50, help="maximum number of runs of each benchmark")
+    parser.add_argument("--budget", type=float, default=1.0, help="maximum seconds spent on each benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency in ms added by the replay server")
+    args = parser.parse_args()
+
+    results = suite.run(args.providers, {size: SIZES[size] for size in args.sizes}, args.repeat, args.budget,
+                        args.latency / 1000, args.groups)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import flexpolyline as fp
+import numpy as np
+
+# Number of points of the synthetic routes
+SIZES = {"short": 100, "medium": 2000, "cross-country": 50000}
+
+def route(points: int, seed: int = 0):
+    # Random walk of [lat, lng] starting in Milan, with steps of ~10 m
+    rng = np.random.default_rng(seed)
+    return np.round(np.array([45.4642, 9.19]) + np.cumsum(rng.normal(0, 1e-4, (points, 2)), axis=0), 6)
+
+def response(provider: str, points: int, compute_path: bool, seed: int = 0):
+    # Response of a provider for a route with the given number of points
+    path = route(points, seed)
+    distance = 10.0 * points
+    duration = 1.0 * points
+
+    if provider == "Here":
+        section = {"travelSummary": {"length": int(distance), "duration": int(duration)}}
+        if compute_path:
+            section["polyline"] = fp.encode_path(path, 5)
+        return {"routes": [{"sections": [section]}]}
+
+    if provider == "TomTom":
+        summary = {"lengthInMeters": int(distance), "travelTimeInSeconds": int(duration), "trafficDelayInSeconds": 0}
+        leg = {"summary": summary}
+        if compute_path:
+            leg["points"] = [{"latitude": lat, "longitude": lng} for lat, lng in path.tolist()]
+        return {"routes": [{"summary": summary, "legs": [leg]}]}
+
+    if provider == "Mapbox":
+        route_ = {"distance": distance, "duration": duration, "legs": [{"distance": distance, "duration": duration}]}
+        if compute_path:
+            route_["geometry"] = {"type": "LineString", "coordinates": path[:, ::-1].tolist()}
+        return {"routes": [route_]}
+
+    if provider == "ArcGIS":
+        feature = {"attributes": {"Total_Kilometers": distance / 1000, "Total_TravelTime": duration / 60}}
+        if compute_path:
+            feature["geometry"] = {"paths": [path[:, ::-1].tolist()]}
+        return {"routes": {"features": [feature]}}
+
+    if provider == "BingMaps":
+        resource = {"travelDistance": distance / 1000, "travelDurationTraffic": duration,
+                    "routeLegs": [{"travelDistance": distance / 1000, "travelDuration": duration}]}
+        if compute_path:
+            resource["routePath"] = {"line": {"coordinates": path.tolist()}}
+        return {"resourceSets": [{"resources": [resource]}]}
+
+    if provider == "MapQuest":
+        route_ = {"distance": distance / 1000, "realTime": duration, "legs": [{"distance": distance / 1000, "time": duration}]}
+        if compute_path:
+            route_["shape"] = {"shapePoints": path.ravel().tolist()}
+        return {"route": route_}
+
+    if provider == "GoogleMaps":
+        leg = {"distanceMeters": int(distance), "duration": str(int(duration)) + "s"}
+        if compute_path:
+            # One step for each point, with both the locations read by the parser
+            leg["steps"] = [{"polyline": {"geoJsonLinestring": {"latitude": lat, "longitude": lng}},
+                             "end_location": {"latLng": {"latitude": lat, "longitude": lng}}} for lat, lng in path.tolist()]
+        return {"routes": [{"distanceMeters": int(distance), "duration": str(int(duration)) + "s", "legs": [leg]}]}
+
+    raise ValueError("Unknown provider: " + provider)
+
+# Providers with a fixture (AppleMaps can't parse a response yet)
+PROVIDERS = ["Here", "TomTom", "Mapbox", "ArcGIS", "BingMaps", "MapQuest", "GoogleMaps"]
@@ -0,0 +1,70 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import socket
+import threading
+import time
+
+class ReplayServer(object):
+
+    def __init__(self, latency: float = 0.0):
+        # latency in seconds, added before every response
+        self.latency = latency
+        self.requests = 0
+        self._body = b"{}"
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # Headers and body are written separately: without this, Nagle's algorithm adds ~40 ms to each response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    self.rfile.read(length)
+                if server.latency:
+                    time.sleep(server.latency)
+                server.requests += 1
+                body = server._body
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self._server.server_port) + "/"
+
+    def serve(self, response):
+        # Every request from now on is answered with this response
+        self._body = json.dumps(response).encode()
+        return len(self._body)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,157 @@
+from typing import Optional
+from benchmarks.fixtures import PROVIDERS, SIZES, response, route
+from benchmarks.server import ReplayServer
+from client import Client
+import flexpolyline as fp
+import numpy as np
+import importlib
+import platform
+import subprocess
+import time
+import tracemalloc
+
+# Module of each provider
+MODULES = {"Here": "here", "TomTom": "tomtom", "Mapbox": "mapbox", "ArcGIS": "arcgis", "BingMaps": "bingmaps",
+           "MapQuest": "mapquest", "GoogleMaps": "googlemaps", "AppleMaps": "applemaps"}
+
+def expert_class(provider: str):
+    return getattr(importlib.import_module(MODULES[provider]), provider)
+
+def measure(fn, repeat: int = 50, budget: float = 1.0):
+    # Time fn up to "repeat" times (at least 3) or until "budget" seconds are spent
+    # Peak memory is measured on a separate call, since tracemalloc slows down the timed ones
+    fn()
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < 3 or (len(timings) < repeat and time.perf_counter() - start < budget):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = np.array(timings)
+    return {"n": int(timings.shape[0]),
+            "throughput": float(timings.shape[0] / timings.sum()),
+            "p50_ms": float(np.percentile(timings, 50) * 1000),
+            "p99_ms": float(np.percentile(timings, 99) * 1000),
+            "peak_kb": peak / 1024}
+
+def bench_flexpolyline(sizes: dict, repeat: int, budget: float):
+    results = []
+    for size, points in sizes.items():
+        path = route(points)
+        encoded = fp.encode_path(path, 6)
+        encoded_list = fp.encode(path, 6, True)
+        cases = {"encode_path": lambda: fp.encode_path(path, 6),
+                 "decode_path": lambda: fp.decode_path(encoded),
+                 "encode_list": lambda: fp.encode(path, 6, True),
+                 "decode_list": lambda: fp.decode(encoded_list, True)}
+        for name, fn in cases.items():
+            results.append(dict(benchmark="flexpolyline." + name, size=size, points=points, **measure(fn, repeat, budget)))
+    return results
+
+def bench_parse(providers: list, sizes: dict, repeat: int, budget: float):
+    # Parsing includes the decoding of the path, which Direction otherwise defers to the first access
+    results = []
+    for provider in providers:
+        cls = expert_class(provider)
+        for size, points in sizes.items():
+            for compute_path in (False, True):
+                body = response(provider, points, compute_path)
+
+                def parse():
+                    direction = cls._parse_request(body, compute_path)
+                    if direction is not None and direction.has_path:
+                        direction.coordinates
+
+                results.append(dict(benchmark="parse", provider=provider, size=size, points=points, compute_path=compute_path,
+                                    **measure(parse, repeat, budget)))
+    return results
+
+def bench_request(providers: list, repeat: int, budget: float, calls: int = 1000):
+    # Per-request overhead of building the request and its URL, without sending it
+    results = []
+    rng = np.random.default_rng(0)
+    for provider in providers:
+        expert = expert_class(provider)("benchmark")
+        for count in sorted({2, min(10, expert.max_waypoints)}):
+            waypoints = np.column_stack((rng.uniform(36, 47, count), rng.uniform(6, 18, count)))
+
+            def build():
+                for _ in range(calls):
+                    method, url, params, headers = expert._build_request(waypoints, "2023-10-31T10:37", False)
+                    if method == "GET":
+                        Client._generate_url(url, params)
+
+            stats = measure(build, repeat, budget)
+            results.append(dict(benchmark="request", provider=provider, waypoints=count,
+                                per_request_us=stats["p50_ms"] * 1000 / calls, **stats))
+        expert.close()
+    return results
+
+def bench_client(server: ReplayServer, sizes: dict, repeat: int, budget: float):
+    # Raw round trip of Client against the replay server
+    results = []
+    with Client(base_url=server.url) as client:
+        for size, points in sizes.items():
+            for compute_path in (False, True):
+                nbytes = server.serve(response("Here", points, compute_path))
+                results.append(dict(benchmark="client.request_get", size=size, points=points, compute_path=compute_path,
+                                    bytes=nbytes, **measure(lambda: client.request_get(server.url, {"q": "1"}, {}), repeat, budget)))
+    return results
+
+def bench_query(server: ReplayServer, providers: list, sizes: dict, repeat: int, budget: float):
+    # End-to-end Expert.query: request building, round trip, JSON parsing and path parsing
+    results = []
+    source = np.array([45.4642, 9.19])
+    destination = np.array([45.0703, 7.6869])
+    for provider in providers:
+        expert = expert_class(provider)("benchmark")
+        expert.base_url = server.url
+        # The replay server has no rate limit
+        expert.client.limiter = None
+        for size, points in sizes.items():
+            for compute_path in (False, True):
+                nbytes = server.serve(response(provider, points, compute_path))
+                results.append(dict(benchmark="query", provider=provider, size=size, points=points, compute_path=compute_path,
+                                    bytes=nbytes, **measure(lambda: expert.query(source, destination, None, compute_path),
+                                                            repeat, budget)))
+        expert.close()
+    return results
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run(providers: Optional[list] = None, sizes: Optional[dict] = None, repeat: int = 50, budget: float = 1.0,
+        latency: float = 0.0, groups: Optional[list] = None):
+    # latency in seconds, added by the replay server to every response
+    providers = providers or PROVIDERS
+    sizes = sizes or SIZES
+    groups = groups or ["flexpolyline", "parse", "request", "client", "query"]
+
+    results = []
+    if "flexpolyline" in groups:
+        results += bench_flexpolyline(sizes, repeat, budget)
+    if "parse" in groups:
+        results += bench_parse(providers, sizes, repeat, budget)
+    if "request" in groups:
+        results += bench_request(providers, repeat, budget)
+    if "client" in groups or "query" in groups:
+        with ReplayServer(latency) as server:
+            if "client" in groups:
+                results += bench_client(server, sizes, repeat, budget)
+            if "query" in groups:
+                results += bench_query(server, providers, sizes, repeat, budget)
+
+    return {"commit": commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "latency_ms": latency * 1000,
+            "results": results}
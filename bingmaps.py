@@ -1,27 +1,34 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _path(path: list):
+    return np.array(path, dtype=float)
+
 class BingMaps(Expert):
 
+    max_waypoints = 25
+
     def __init__(self, key: str):
         self.key = key
         self.base_url = "http://dev.virtualearth.net/REST/V1/Routes/Driving"
-        self.client = Client(base_url=self.base_url)
-    
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/json"}
+
+    def _static_params(self, compute_path: bool):
         # For more information, visit https://learn.microsoft.com/en-us/bingmaps/rest-services/routes/calculate-a-route
 
         params = {}
-        params["wp.0"] = str(source[0])+","+str(source[1])
-        params["wp.1"] = str(destination[0])+","+str(destination[1])
         params["key"] = self.key
         params["optimize"] = "timeWithTraffic"
 
@@ -31,13 +38,17 @@ class BingMaps(Expert):
         else:
             params["routeAttributes"] = "routeSummariesOnly"    
 
+        return params
+    
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        query = "&".join("wp." + str(i) + "=" + QUERY_POINT % tuple(p) for i, p in enumerate(waypoints.tolist()))
+
         if departure:
             # ISO 8601-format (e.g, 2023-10-31T10:37)
-            params["timeType"] = "Departure"
-            params["dateTime"] = departure
+            query += "&timeType=Departure&dateTime=" + quote_value(departure)
         
-        return self._parse_request(self.client.request_get(base_url=self.base_url, params=params,
-                                                           headers={"Content-Type": "application/json"}), compute_path)
+        return "GET", self.base_url, query + "&" + self._templates[bool(compute_path)], self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -46,17 +57,69 @@ class BingMaps(Expert):
             # From Km to m
             distance = round(distance * 1000)
             duration = response["resourceSets"][0]["resources"][0]["travelDurationTraffic"]
+
+            # There is a leg between each pair of consecutive waypoints
+            legs = response["resourceSets"][0]["resources"][0].get("routeLegs", [])
+            leg_distances = [round(leg["travelDistance"] * 1000) for leg in legs] or None
+            leg_durations = [leg.get("travelDurationTraffic", leg["travelDuration"]) for leg in legs] or None
             
             if compute_path:
-                path = np.array([], dtype = str)
-                points = np.array(response["resourceSets"][0]["resources"][0]["routePath"]["line"]["coordinates"], dtype=float)
-                path = fp.encode(points, 6, True)
+                # path is an array of [[lat1, lng1], [lat2, lng2], ...], converted on the first access
+                path = response["resourceSets"][0]["resources"][0]["routePath"]["line"]["coordinates"]
                 
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, path, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
         except:
             Path("bingmaps.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())
             print("Please visit: https://learn.microsoft.com/en-us/bingmaps/rest-services/status-codes-and-error-handling")
-            return None
\ No newline at end of file
+            return None
+
+class BingMapsMatrix(MatrixExpert):
+
+    max_origins = 50
+    max_destinations = 50
+    max_cells = 2500
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://dev.virtualearth.net/REST/v1/Routes/DistanceMatrix"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://learn.microsoft.com/en-us/bingmaps/rest-services/routes/calculate-a-distance-matrix
+
+        params = {}
+        params["origins"] = ";".join(str(p[0])+","+str(p[1]) for p in sources)
+        params["destinations"] = ";".join(str(p[0])+","+str(p[1]) for p in destinations)
+        params["travelMode"] = "driving"
+        params["distanceUnit"] = "km"
+        params["timeUnit"] = "second"
+        params["key"] = self.key
+
+        if departure:
+            # ISO 8601-format (e.g, 2023-10-31T10:37)
+            params["startTime"] = departure
+
+        return "GET", self.base_url, params, {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _parse_request(response: dict, shape: tuple):
+        try:
+            distance = np.full(shape, np.nan, dtype=float)
+            duration = np.full(shape, np.nan, dtype=float)
+
+            # Cells without a route have a negative distance
+            for cell in response["resourceSets"][0]["resources"][0]["results"]:
+                if cell["travelDistance"] >= 0:
+                    # From Km to m
+                    distance[cell["originIndex"], cell["destinationIndex"]] = round(cell["travelDistance"] * 1000)
+                    duration[cell["originIndex"], cell["destinationIndex"]] = cell["travelDuration"]
+
+            return distance, duration
+        except:
+            Path("bingmaps_matrix.json").write_text(json.dumps(response, indent=4))
+            print(traceback.format_exc())
+            print("Please visit: https://learn.microsoft.com/en-us/bingmaps/rest-services/status-codes-and-error-handling")
+            return None
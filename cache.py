@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Optional
+import metrics
+import numpy as np
+import pickle
+import sqlite3
+import threading
+import time
+
+def departure_bucket(departure: Optional[str], bucket: int = 300):
+    # Round the departure time down to a bucket of "bucket" seconds
+    # departure can be None (i.e., now), UNIX-format, RFC 3339-format or ISO 8601-format
+    if departure is None:
+        return "now:" + str(int(time.time() // bucket))
+    try:
+        if str(departure).isdigit():
+            timestamp = int(departure)
+        else:
+            timestamp = datetime.fromisoformat(str(departure)).timestamp()
+    except ValueError:
+        return str(departure)
+    return str(int(timestamp // bucket))
+
+def cache_key(provider: str, source: np.ndarray, destination: np.ndarray, departure: Optional[str] = None,
+              compute_path: Optional[bool] = False, precision: int = 4, bucket: int = 300,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+    # Coordinates are quantized to "precision" decimal digits (4 digits are about 11 m)
+    # The simplification is identified by its key (see simplify.Simplifier), or by the callable itself
+    if via is None:
+        via = np.empty(0, dtype=float)
+    coordinates = np.round(np.concatenate((np.asarray(source, dtype=float)[:2], np.asarray(via, dtype=float).ravel(),
+                                           np.asarray(destination, dtype=float)[:2])), precision) + 0.0
+    parts = [provider, ",".join("%.*f" % (precision, c) for c in coordinates), departure_bucket(departure, bucket),
+             str(bool(compute_path))]
+    if simplify is not None:
+        parts.append(str(getattr(simplify, "key", None) or repr(simplify)))
+    return "|".join(parts)
+
+class MemoryCache(object):
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300):
+        # ttl in seconds, None to never expire
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            # Evict the least recently used entries
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache(object):
+
+    def __init__(self, path: str = "ospra_cache.sqlite", ttl: Optional[float] = 86400):
+        # ttl in seconds, None to never expire
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value BLOB)")
+        self._connection.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute("SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                expires, value = row
+                if expires is None or expires > time.time():
+                    self.hits += 1
+                    return pickle.loads(value)
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._connection.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                                     (key, expires, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+            self._connection.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+    def __len__(self):
+        return self.stats()["size"]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class CachedExpert(object):
+
+    def __init__(self, expert, cache=None, precision: int = 4, bucket: int = 300):
+        # cache is a MemoryCache, a SQLiteCache or any object with get(key) and set(key, value)
+        self.expert = expert
+        self.cache = cache if cache is not None else MemoryCache()
+        # Decimal digits of the coordinates and size in seconds of the departure bucket used in the key
+        self.precision = precision
+        self.bucket = bucket
+
+    def __getattr__(self, name: str):
+        # Everything else (e.g., key, base_url, client) is the one of the wrapped expert
+        return getattr(self.expert, name)
+
+    @property
+    def name(self):
+        return self.expert.name
+
+    def key(self, source: np.ndarray, destination: np.ndarray, departure: Optional[str] = None,
+            compute_path: Optional[bool] = False, via: Optional[np.ndarray] = None,
+            simplify: Optional[Callable] = None):
+        return cache_key(self.name, source, destination, departure, compute_path, self.precision, self.bucket, via,
+                         simplify)
+
+    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+              departure: Optional[str] = None, compute_path: Optional[bool] = False,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        key = self.key(source, destination, departure, compute_path, via, simplify)
+        direction = self.cache.get(key)
+        metrics.count("cache_misses" if direction is None else "cache_hits", provider=self.name)
+        if direction is None:
+            direction = self.expert.query(source, destination, departure, compute_path, via, simplify)
+            # Failures are not cached
+            if direction is not None:
+                self.cache.set(key, direction)
+        return direction
+
+    async def aquery(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+                     departure: Optional[str] = None, compute_path: Optional[bool] = False, client=None,
+                     via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        key = self.key(source, destination, departure, compute_path, via, simplify)
+        direction = self.cache.get(key)
+        metrics.count("cache_misses" if direction is None else "cache_hits", provider=self.name)
+        if direction is None:
+            direction = await self.expert.aquery(source, destination, departure, compute_path, client, via,
+                                                 simplify)
+            if direction is not None:
+                self.cache.set(key, direction)
+        return direction
@@ -1,31 +1,261 @@
 import requests
+import random
+import threading
+import time
 import traceback
-from urllib.parse import urlencode
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from typing import Optional, Union
+from urllib.parse import quote_plus, urlencode, urlsplit
+from requests.adapters import HTTPAdapter
+import metrics
+import numpy as np
+import streamjson
+
+# Status codes worth another attempt: throttling and transient server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Coordinates are sent with 6 decimal digits (about 0.1 m), as "lat,lng" and as the same pair already URL-encoded
+POINT = "%.6f,%.6f"
+QUERY_POINT = "%.6f%%2C%.6f"
+
+def encode_params(params: dict):
+    # Encode the string into URL (e.g., replace "," with %2C)
+    # Lists are sent as repeated parameters (e.g., via=...&via=...)
+    return requests.utils.unquote_unreserved(urlencode(params, doseq=True))
+
+def quote_value(value: str):
+    # URL-encode a single value (e.g., a departure time) as encode_params does
+    return requests.utils.unquote_unreserved(quote_plus(str(value), safe=""))
+
+def parse_retry_after(value: Optional[str], max_backoff: float):
+    # Retry-After is either in seconds or an HTTP date; None if missing or invalid
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), max_backoff)
 
 class Client():
 
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, pool_size: int = 10, timeout: Optional[Union[float, tuple]] = (3.05, 27),
+                 keep_alive: bool = True, retries: int = 2, backoff: float = 0.5, max_backoff: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_samples: int = 20, limiter=None):
         self.base_url = base_url
-    
+        # Maximum number of connections kept open to each host
+        self.pool_size = pool_size
+        # (connect, read) timeouts in seconds
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+        # Retries after connection errors, timeouts and RETRY_STATUS responses, with exponential backoff and jitter
+        # backoff is the base delay in seconds, max_backoff caps both the backoff and Retry-After
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # Hedged requests: if no response arrived after the hedge_quantile of the recent latencies of the host,
+        # a duplicate is sent and the first response wins (only once hedge_samples latencies were observed)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_samples = hedge_samples
+        self._latencies = {}
+        self._executor = None
+
+        # Optional ratelimit.AdaptiveBucket: every attempt waits for a token, 429s and latencies adapt its rate
+        self.limiter = limiter
+
+        # One persistent session per base host (e.g., "https://router.hereapi.com")
+        self._sessions = {}
+        self._lock = threading.Lock()
+
     @staticmethod
-    def _generate_url(base_url: str, params: dict):
-        # Encode the string into URL (e.g., replace "," with %2C)
-        full_url = base_url + "?" + requests.utils.unquote_unreserved(urlencode(params))
-        return full_url
+    def _generate_url(base_url: str, params: Union[dict, str]):
+        # params is a dict or a query string that is already encoded (e.g., built from a request template)
+        if isinstance(params, str):
+            return base_url + "?" + params
+        return base_url + "?" + encode_params(params)
 
-    def request_get(self, base_url: str, params: dict, headers: dict):
-        full_url = self._generate_url(base_url, params)
-        try:
-            response = requests.get(full_url, headers=headers)
+    @staticmethod
+    def _host(url: str):
+        parts = urlsplit(url)
+        return parts.scheme + "://" + parts.netloc
+
+    def _session(self, url: str):
+        host = self._host(url)
+
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    if not self.keep_alive:
+                        session.headers["Connection"] = "close"
+                    self._sessions[host] = session
+        return session
+
+    def _send(self, method: str, url: str, **kwargs):
+        # A single attempt, timed to estimate the hedging delay of the host
+        start = time.perf_counter()
+        response = self._session(url).request(method, url, **kwargs)
+        latencies = self._latencies.get(self._host(url))
+        if latencies is None:
+            latencies = self._latencies.setdefault(self._host(url), deque(maxlen=200))
+        latencies.append(time.perf_counter() - start)
+        return response
+
+    def _hedge_delay(self, url: str):
+        latencies = self._latencies.get(self._host(url))
+        if not self.hedge or latencies is None or len(latencies) < self.hedge_samples:
+            return None
+        return float(np.quantile(latencies, self.hedge_quantile))
+
+    def _attempt(self, method: str, url: str, **kwargs):
+        delay = self._hedge_delay(url)
+        if delay is None:
+            return self._send(method, url, **kwargs)
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2 * self.pool_size)
+
+        first = self._executor.submit(self._send, method, url, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        # Slower than usual: send a duplicate and keep whichever answers first
+        metrics.count("hedges")
+        pending = {first, self._executor.submit(self._send, method, url, **kwargs)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The losing request is closed as soon as it completes
+                    for other in pending:
+                        other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _retry_after(self, response: requests.Response):
+        return parse_retry_after(response.headers.get("Retry-After"), self.max_backoff)
+
+    def _backoff(self, attempt: int):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _request(self, method: str, url: str, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None and not self.limiter.acquire():
+                metrics.count("quota_exhausted")
+                raise RuntimeError("The daily quota of the provider is exhausted.")
+            start = time.perf_counter()
+            try:
+                response = self._attempt(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                retry_after = self._retry_after(response)
+                if self.limiter is not None:
+                    if response.status_code == 429:
+                        metrics.count("throttled")
+                        self.limiter.throttled(retry_after)
+                    elif response.status_code < 500:
+                        self.limiter.succeeded(time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return response
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                response.close()
+            metrics.count("retries")
+            time.sleep(delay)
+
+    @staticmethod
+    def _chunks(response: requests.Response):
+        for chunk in response.iter_content(chunk_size=65536):
+            metrics.count("received_bytes", len(chunk))
+            yield chunk
+
+    @staticmethod
+    def _json(response: requests.Response, stream_key: Optional[str] = None, raw: bool = False):
+        if raw:
+            # The undecoded body, e.g. to be parsed in another process
+            metrics.count("received_bytes", len(response.content))
+            return response.content
+        if stream_key is None:
+            metrics.count("received_bytes", len(response.content))
             return response.json()
+        # The coordinate arrays named stream_key are parsed while the body is downloaded
+        with response:
+            return streamjson.parse(Client._chunks(response), stream_key, int(response.headers.get("Content-Length", 0)))
+
+    def request_get(self, base_url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                    raw: bool = False):
+        with metrics.timer("url"):
+            full_url = self._generate_url(base_url, params)
+        try:
+            # Without stream_key, the body is downloaded within the network stage
+            with metrics.timer("network"):
+                response = self._request("GET", full_url, headers=headers, timeout=self.timeout,
+                                         stream=stream_key is not None)
+            with metrics.timer("decode"):
+                return self._json(response, stream_key, raw)
         except:
+            metrics.count("errors")
             print(traceback.format_exc())
             return None
     
-    def request_post(self, full_url: str, params: dict, headers: dict):
+    def request_post(self, full_url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                     raw: bool = False):
         try:
-            response = requests.post(full_url, headers=headers, data=params)
-            return response.json()
+            with metrics.timer("network"):
+                if headers.get("Content-Type") == "application/json":
+                    response = self._request("POST", full_url, headers=headers, json=params, timeout=self.timeout,
+                                             stream=stream_key is not None)
+                else:
+                    response = self._request("POST", full_url, headers=headers, data=params, timeout=self.timeout,
+                                             stream=stream_key is not None)
+            with metrics.timer("decode"):
+                return self._json(response, stream_key, raw)
         except:
+            metrics.count("errors")
             print(traceback.format_exc())
-            return None
\ No newline at end of file
+            return None
+
+    def request(self, method: str, url: str, params: dict, headers: dict, stream_key: Optional[str] = None,
+                raw: bool = False):
+        # Send a request built by Expert._build_request
+        # raw: return the body as bytes instead of the decoded JSON
+        if method == "GET":
+            return self.request_get(base_url=url, params=params, headers=headers, stream_key=stream_key, raw=raw)
+        else:
+            return self.request_post(full_url=url, params=params, headers=headers, stream_key=stream_key, raw=raw)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,12 +1,59 @@
-from typing import Optional
+from typing import Callable, Optional
+import flexpolyline as fp
 import numpy as np
 
+# Decimal digits of precision of the encoded paths
+PRECISION = 6
+
+def _polylines(path: np.ndarray):
+    return fp.decode(path, is_list=True)
+
+def _concatenate(directions: list):
+    return np.concatenate([direction.coordinates for direction in directions])
+
 class Direction(object):
-    
-    def __init__(self, distance: float, duration: float, path: Optional[np.ndarray] = None):
+
+    __slots__ = ("_distance", "_duration", "_coordinates", "_leg_distances", "_leg_durations", "_pending",
+                 "_path_length")
+
+    def __init__(self, distance: float, duration: float, path: Optional[np.ndarray] = None,
+                 leg_distances: Optional[np.ndarray] = None, leg_durations: Optional[np.ndarray] = None,
+                 decoder: Optional[Callable] = None, path_length: Optional[float] = None):
         self._distance = distance
         self._duration = duration
-        self._path = path
+        # Length in metres of the original path when it was simplified, None otherwise
+        self._path_length = path_length
+
+        # Distance and duration of every leg between two consecutive waypoints
+        self._leg_distances = None if leg_distances is None else np.asarray(leg_distances, dtype=float)
+        self._leg_durations = None if leg_durations is None else np.asarray(leg_durations, dtype=float)
+
+        # path can be an (N,2) array of [lat, lng], an array of polylines [polyline0, polyline1, ...]
+        # or the raw payload of a provider, with the decoder that turns it into an (N,2) array of [lat, lng]
+        # Polylines and raw payloads are decoded on the first access to the path, so a malformed path is not caught
+        # (nor dumped) by the parser of the provider: the access raises a ValueError instead
+        # The (raw payload, decoder) pair is a single attribute, so that threads never see one without the other
+        self._coordinates = None
+        self._pending = None
+        if path is not None:
+            if decoder is None:
+                path = np.asarray(path)
+                if path.dtype.kind in ("U", "S", "O"):
+                    decoder = _polylines
+            if decoder is None:
+                self._coordinates = self._normalize(path)
+            else:
+                self._pending = (path, decoder)
+
+    @staticmethod
+    def _normalize(path: np.ndarray):
+        # Stored as a contiguous (N,2) float64 buffer
+        return np.ascontiguousarray(path, dtype=float).reshape(-1, 2)
+
+    @property
+    def has_path(self):
+        # Whether there is a path, without decoding it
+        return self._coordinates is not None or self._pending is not None
 
     @property
     def distance(self):
@@ -16,6 +63,70 @@ class Direction(object):
     def duration(self):
         return self._duration
 
+    @property
+    def path_length(self):
+        return self._path_length
+
+    @property
+    def leg_distances(self):
+        # A route without waypoints has a single leg
+        if self._leg_distances is None:
+            return np.array([self._distance], dtype=float)
+        return self._leg_distances
+
+    @property
+    def leg_durations(self):
+        if self._leg_durations is None:
+            return np.array([self._duration], dtype=float)
+        return self._leg_durations
+
+    @property
+    def coordinates(self):
+        # 2-dimensional array of [[lat0, lng0], [lat1, lng1], ...]
+        # Threads racing on the first access may both decode, but the path is published before the payload is released
+        pending = self._pending
+        if pending is not None:
+            raw, decoder = pending
+            try:
+                coordinates = decoder(raw)
+            except Exception as e:
+                raise ValueError("Malformed path: " + repr(e)) from e
+            self._coordinates = self._normalize(coordinates)
+            self._pending = None
+        return self._coordinates
+
     @property
     def path(self):
-        return self._path
\ No newline at end of file
+        # 1-dimensional array of polylines [polyline0, polyline1, ...], built on each access
+        if not self.has_path:
+            return None
+        return fp.encode(self.coordinates, PRECISION, is_list=True)
+
+    @property
+    def polyline(self):
+        # Single polyline that encodes the entire path
+        if not self.has_path:
+            return None
+        return fp.encode_path(self.coordinates, PRECISION)
+
+    @property
+    def geojson(self):
+        # GeoJSON LineString, in [lng, lat]-format
+        if not self.has_path:
+            return None
+        return {"type": "LineString", "coordinates": self.coordinates[:, ::-1].tolist()}
+
+    @staticmethod
+    def join(directions: list):
+        # Chain the Directions of consecutive legs into a single Direction
+        if len(directions) == 0 or any(direction is None for direction in directions):
+            return None
+
+        # The paths of the legs are decoded and concatenated on the first access to the path
+        has_path = all(direction.has_path for direction in directions)
+
+        return Direction(sum(direction.distance for direction in directions),
+                         sum(direction.duration for direction in directions), list(directions) if has_path else None,
+                         np.concatenate([direction.leg_distances for direction in directions]),
+                         np.concatenate([direction.leg_durations for direction in directions]),
+                         _concatenate if has_path else None)
@@ -0,0 +1,148 @@
+from typing import Optional
+from orchestrator import Orchestrator
+import numpy as np
+import threading
+
+# Scale of the median absolute deviation to estimate the standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+
+def _nanmedian(values: np.ndarray):
+    # Median of each column ignoring NaN (NaN if the column has no value), by sorting the few providers of each column
+    if values.shape[0] == 0:
+        return np.full(values.shape[1:], np.nan)
+    # NaN are sorted last
+    ordered = np.sort(values, axis=0)
+    count = np.sum(~np.isnan(values), axis=0)
+    low = np.take_along_axis(ordered, np.maximum((count - 1) // 2, 0)[None, :], axis=0)[0]
+    high = np.take_along_axis(ordered, np.minimum(count // 2, values.shape[0] - 1)[None, :], axis=0)[0]
+    return np.where(count > 0, (low + high) / 2, np.nan)
+
+def median(values: np.ndarray, weights: Optional[np.ndarray] = None, trim: float = 0.2):
+    # values is a (P,N) array of P providers for N pairs, NaN where a provider failed
+    return _nanmedian(values)
+
+def trimmed_mean(values: np.ndarray, weights: Optional[np.ndarray] = None, trim: float = 0.2):
+    # Mean of each column without the "trim" fraction of its lowest and highest valid values
+    ordered = np.sort(values, axis=0)
+    count = np.sum(~np.isnan(values), axis=0)
+    cut = np.floor(count * trim).astype(int)
+    rank = np.arange(values.shape[0])[:, None]
+    keep = (rank >= cut) & (rank < count - cut)
+    with np.errstate(all="ignore"):
+        return np.where(keep, ordered, 0.0).sum(axis=0) / keep.sum(axis=0)
+
+def weighted_mean(values: np.ndarray, weights: Optional[np.ndarray] = None, trim: float = 0.2):
+    # weights is a (P,) array, e.g. the inverse of the historical error of each provider
+    weights = np.ones(values.shape[0]) if weights is None else np.asarray(weights, dtype=float)
+    valid = ~np.isnan(values)
+    weights = np.where(valid, weights[:, None], 0.0)
+    with np.errstate(all="ignore"):
+        return (np.where(valid, values, 0.0) * weights).sum(axis=0) / weights.sum(axis=0)
+
+METHODS = {"median": median, "trimmed_mean": trimmed_mean, "weighted": weighted_mean}
+
+def outliers(values: np.ndarray, threshold: float = 3.0, tolerance: float = 0.05):
+    # True where a value is farther than "threshold" robust standard deviations (from the median absolute deviation)
+    # and farther than "tolerance" (relative) from the median of its column
+    center = _nanmedian(values)
+    deviation = np.abs(values - center)
+    scale = MAD_SCALE * _nanmedian(deviation)
+    return (deviation > threshold * scale) & (deviation > tolerance * np.abs(center))
+
+class Consensus(object):
+
+    __slots__ = ("providers", "distance", "duration", "count", "outliers")
+
+    def __init__(self, providers: list, distance: np.ndarray, duration: np.ndarray, count: np.ndarray,
+                 outliers: np.ndarray):
+        self.providers = providers
+        # Consensus distance (m) and duration (s) of each pair, NaN where every provider failed
+        self.distance = distance
+        self.duration = duration
+        # Number of providers that answered each pair (outliers included)
+        self.count = count
+        # (P,N) array, True where the distance or the duration of a provider is an outlier
+        self.outliers = outliers
+
+class Ensemble(object):
+
+    def __init__(self, method: str = "median", trim: float = 0.2, threshold: float = 3.0, tolerance: float = 0.05,
+                 exclude_outliers: bool = True, alpha: float = 0.1):
+        # method is "median", "trimmed_mean" (without the "trim" fraction at both ends) or "weighted"
+        # (by the inverse of the historical relative error of each provider)
+        if method not in METHODS:
+            raise ValueError("Unknown consensus method: " + str(method))
+        self.method = method
+        self.trim = trim
+        self.threshold = threshold
+        self.tolerance = tolerance
+        # Whether the outliers are left out of the consensus
+        self.exclude_outliers = exclude_outliers
+
+        # Exponentially weighted moving average of the relative error of each provider against the consensus
+        self.alpha = alpha
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def weights(self, providers: list):
+        # Providers never observed get the weight of an average provider
+        with self._lock:
+            default = float(np.mean(list(self.errors.values()))) if self.errors else 1.0
+            errors = np.array([self.errors.get(provider, default) for provider in providers], dtype=float)
+        return 1.0 / np.maximum(errors, 1e-3)
+
+    def _update(self, providers: list, distance: np.ndarray, duration: np.ndarray, consensus: "Consensus"):
+        # Mean relative error of the distances and durations of each provider, NaN if it failed on every pair
+        with np.errstate(all="ignore"):
+            errors = np.concatenate((np.abs(distance - consensus.distance) / np.abs(consensus.distance),
+                                     np.abs(duration - consensus.duration) / np.abs(consensus.duration)), axis=1)
+            valid = np.isfinite(errors)
+            error = np.where(valid, errors, 0.0).sum(axis=1) / valid.sum(axis=1)
+        with self._lock:
+            for provider, e in zip(providers, error):
+                if not np.isnan(e):
+                    previous = self.errors.get(provider)
+                    self.errors[provider] = float(e if previous is None else previous + self.alpha * (e - previous))
+
+    def combine(self, providers: list, distance: np.ndarray, duration: np.ndarray):
+        # distance and duration are (P,N) arrays of P providers for N pairs, NaN where a provider failed
+        distance = np.asarray(distance, dtype=float).reshape(len(providers), -1)
+        duration = np.asarray(duration, dtype=float).reshape(len(providers), -1)
+        combine = METHODS[self.method]
+        weights = self.weights(providers)
+
+        flags = outliers(distance, self.threshold, self.tolerance) | outliers(duration, self.threshold, self.tolerance)
+        if self.exclude_outliers:
+            kept_distance = np.where(flags, np.nan, distance)
+            kept_duration = np.where(flags, np.nan, duration)
+        else:
+            kept_distance, kept_duration = distance, duration
+
+        consensus = Consensus(list(providers), combine(kept_distance, weights, self.trim),
+                              combine(kept_duration, weights, self.trim),
+                              np.sum(~np.isnan(distance), axis=0), flags)
+        self._update(providers, distance, duration, consensus)
+        return consensus
+
+    def combine_batches(self, results: dict):
+        # results is {provider: BatchResult} of the same pairs (or matrix); the Consensus arrays take their shape
+        providers = list(results)
+        if not providers:
+            return Consensus([], np.empty(0), np.empty(0), np.zeros(0, dtype=int), np.zeros((0, 0), dtype=bool))
+        shape = np.shape(next(iter(results.values())).distance)
+        consensus = self.combine(providers, np.stack([np.ravel(results[p].distance) for p in providers]),
+                                 np.stack([np.ravel(results[p].duration) for p in providers]))
+        consensus.distance = consensus.distance.reshape(shape)
+        consensus.duration = consensus.duration.reshape(shape)
+        consensus.count = consensus.count.reshape(shape)
+        consensus.outliers = consensus.outliers.reshape((len(providers),) + shape)
+        return consensus
+
+    def query(self, orchestrator: Orchestrator, source: np.array([], dtype=float),
+              destination: np.array([], dtype=float), departure: Optional[str] = None):
+        # Query every expert of the orchestrator and combine the Directions of a single pair
+        results = orchestrator.query(source, destination, departure)
+        providers = [result.provider for result in results]
+        distance = np.array([result.direction.distance if result.ok else np.nan for result in results], dtype=float)
+        duration = np.array([result.direction.duration if result.ok else np.nan for result in results], dtype=float)
+        return self.combine(providers, distance, duration)
@@ -0,0 +1,179 @@
+from typing import Callable, Optional
+from batch import Batch, BatchResult
+from direction import Direction
+from geometry import haversine
+import metrics
+import numpy as np
+import threading
+
+# Ratio of the road distance to the great-circle distance, and speed in m/s, of the providers never fitted
+DETOUR = 1.3
+SPEED = 12.0
+
+class Estimator(object):
+
+    def __init__(self, min_distance: float = 50.0, max_distance: Optional[float] = None, detour: float = DETOUR,
+                 speed: float = SPEED, min_samples: int = 20):
+        # Pairs whose great-circle distance is below "min_distance" or above "max_distance" metres are trivial:
+        # they are answered locally, identical points with 0 and the others with an estimate
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        # Linear model of the road distance and of the duration from the great-circle distance, fitted by least
+        # squares for each provider once it has "min_samples" observations (detour and speed until then)
+        self.detour = detour
+        self.speed = speed
+        self.min_samples = min_samples
+        # Sums of [1, x, x^2, d, x*d, t, x*t] of each provider, x being the great-circle distance,
+        # d the distance and t the duration of a route
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def great_circle(sources: np.ndarray, destinations: np.ndarray):
+        # (N,) great-circle distance in metres of the pairs (sources[i], destinations[i])
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        return haversine(sources[:, 0], sources[:, 1], destinations[:, 0], destinations[:, 1])
+
+    def trivial(self, straight: np.ndarray):
+        # True where a pair of great-circle distance "straight" does not need a provider
+        trivial = straight < self.min_distance
+        if self.max_distance is not None:
+            trivial |= straight > self.max_distance
+        return trivial
+
+    def observe(self, provider: str, sources: np.ndarray, destinations: np.ndarray, distance: np.ndarray,
+                duration: np.ndarray):
+        # Add the routes reported by a provider to its model; NaN (failed queries) are ignored
+        x = self.great_circle(sources, destinations)
+        d = np.asarray(distance, dtype=float).ravel()
+        t = np.asarray(duration, dtype=float).ravel()
+        valid = ~(np.isnan(d) | np.isnan(t)) & (x > 0)
+        x, d, t = x[valid], d[valid], t[valid]
+        sums = np.array([x.shape[0], x.sum(), (x * x).sum(), d.sum(), (x * d).sum(), t.sum(), (x * t).sum()])
+        with self._lock:
+            self._sums[provider] = self._sums.get(provider, np.zeros(7)) + sums
+        return int(x.shape[0])
+
+    def fit_result(self, provider: str, sources: np.ndarray, destinations: np.ndarray, result: BatchResult):
+        # Observe the pairs of a BatchResult of shape (N,)
+        return self.observe(provider, sources, destinations, result.distance, result.duration)
+
+    def fit_store(self, store, provider: str):
+        # Observe the routes of a provider stored in a store.RouteStore
+        return self.observe(provider, *store.samples(provider))
+
+    def coefficients(self, provider: str):
+        # (intercept, slope) of the distance and of the duration as functions of the great-circle distance
+        with self._lock:
+            sums = self._sums.get(provider)
+        if sums is not None and sums[0] >= self.min_samples:
+            n, sx, sxx = sums[:3]
+            variance = n * sxx - sx * sx
+            if variance > 0:
+                def line(sy: float, sxy: float):
+                    slope = (n * sxy - sx * sy) / variance
+                    return float((sy - slope * sx) / n), float(slope)
+                return line(sums[3], sums[4]), line(sums[5], sums[6])
+        return (0.0, self.detour), (0.0, self.detour / self.speed)
+
+    def estimate(self, provider: str, sources: np.ndarray, destinations: np.ndarray,
+                 straight: Optional[np.ndarray] = None):
+        # (N,) estimated distances (m) and durations (s), never shorter than the great-circle distance;
+        # identical points are 0
+        if straight is None:
+            straight = self.great_circle(sources, destinations)
+        (a, b), (c, e) = self.coefficients(provider)
+        distance = np.maximum(a + b * straight, straight)
+        duration = np.maximum(c + e * straight, 0.0)
+        identical = straight == 0
+        return np.where(identical, 0.0, distance), np.where(identical, 0.0, duration)
+
+    @staticmethod
+    def _direction(source: np.ndarray, destination: np.ndarray, distance: float, duration: float,
+                   compute_path: bool):
+        # Estimated Direction, whose path is the straight line between the points
+        path = np.array([source[:2], destination[:2]], dtype=float) if compute_path else None
+        return Direction(float(distance), float(duration), path)
+
+    def query(self, batch: Batch, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None,
+              compute_path: Optional[bool] = False, mode: str = "refine", fallback: bool = True, learn: bool = True,
+              simplify: Optional[Callable] = None):
+        # Query the pairs (sources[i], destinations[i]) of two (N,2) arrays with the expert of a Batch
+        # mode is "estimate" (no request at all) or "refine" (trivial pairs are answered locally, the others are
+        # queried, and estimated if the query failed and "fallback" is set); "learn" fits the model on the answers
+        # Return a BatchResult of shape (N,) and the (N,) mask of the estimated pairs
+        if mode not in ("estimate", "refine"):
+            raise ValueError("Unknown estimation mode: " + str(mode))
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        if sources.shape != destinations.shape:
+            raise ValueError("sources and destinations must have the same shape.")
+        provider = batch.expert.name
+
+        straight = self.great_circle(sources, destinations)
+        distance, duration = self.estimate(provider, sources, destinations, straight)
+        estimated = np.ones(straight.shape[0], dtype=bool) if mode == "estimate" else self.trivial(straight)
+        directions = np.empty(straight.shape[0], dtype=object)
+
+        queried = np.flatnonzero(~estimated)
+        if queried.shape[0] > 0:
+            result = batch.query(sources[queried], destinations[queried], departure, compute_path, simplify)
+            if learn:
+                self.observe(provider, sources[queried], destinations[queried], result.distance, result.duration)
+            answered = ~result.mask if fallback else np.ones(queried.shape[0], dtype=bool)
+            distance[queried[answered]] = result.distance[answered]
+            duration[queried[answered]] = result.duration[answered]
+            directions[queried[answered]] = result.directions[answered]
+            estimated[queried[~answered]] = True
+
+        for i in np.flatnonzero(estimated):
+            directions[i] = self._direction(sources[i], destinations[i], distance[i], duration[i], compute_path)
+        metrics.count("estimated", int(estimated.sum()), provider=provider)
+        return BatchResult(distance, duration, np.isnan(distance), directions), estimated
+
+class EstimatedExpert(object):
+
+    def __init__(self, expert, estimator: Estimator, estimate_only: bool = False, learn: bool = True):
+        # Trivial pairs (or every pair if estimate_only) are answered by the estimator instead of the provider,
+        # whose answers are observed by the estimator if "learn" is set
+        self.expert = expert
+        self.estimator = estimator
+        self.estimate_only = estimate_only
+        self.learn = learn
+
+    def __getattr__(self, name: str):
+        return getattr(self.expert, name)
+
+    @property
+    def name(self):
+        return self.expert.name
+
+    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+              departure: Optional[str] = None, compute_path: Optional[bool] = False,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        # Routes through waypoints are always queried; the straight paths of the estimates are not simplified
+        if via is None or len(via) == 0:
+            straight = self.estimator.great_circle(source, destination)
+            if self.estimate_only or self.estimator.trivial(straight)[0]:
+                metrics.count("estimated", provider=self.name)
+                distance, duration = self.estimator.estimate(self.name, source, destination, straight)
+                return self.estimator._direction(source, destination, distance[0], duration[0], compute_path)
+        direction = self.expert.query(source, destination, departure, compute_path, via, simplify)
+        if self.learn and direction is not None and (via is None or len(via) == 0):
+            self.estimator.observe(self.name, source, destination, [direction.distance], [direction.duration])
+        return direction
+
+    async def aquery(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+                     departure: Optional[str] = None, compute_path: Optional[bool] = False, client=None,
+                     via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        if via is None or len(via) == 0:
+            straight = self.estimator.great_circle(source, destination)
+            if self.estimate_only or self.estimator.trivial(straight)[0]:
+                metrics.count("estimated", provider=self.name)
+                distance, duration = self.estimator.estimate(self.name, source, destination, straight)
+                return self.estimator._direction(source, destination, distance[0], duration[0], compute_path)
+        direction = await self.expert.aquery(source, destination, departure, compute_path, client, via, simplify)
+        if self.learn and direction is not None and (via is None or len(via) == 0):
+            self.estimator.observe(self.name, source, destination, [direction.distance], [direction.duration])
+        return direction
@@ -0,0 +1,136 @@
+from typing import Optional
+import json
+import numpy as np
+import os
+import struct
+
+# Size in bytes of the .npy headers, reserved when a column is created and rewritten with the final shape on close
+HEADER_SIZE = 128
+
+# name: (dtype, shape of an item)
+COLUMNS = {"distance": ("<f8", ()), "duration": ("<f8", ()), "mask": ("|b1", ()), "offsets": ("<i8", ()),
+           "coordinates": ("<f8", (2,))}
+
+def _header(dtype: str, shape: tuple):
+    # .npy format version 1.0
+    header = repr({"descr": dtype, "fortran_order": False, "shape": shape}).ljust(HEADER_SIZE - 11) + "\n"
+    return np.lib.format.magic(1, 0) + struct.pack("<H", len(header)) + header.encode("latin1")
+
+class Column(object):
+
+    def __init__(self, path: str, dtype: str, shape: tuple = ()):
+        # Append-only .npy file, written in place without keeping the data in memory
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+        self.length = 0
+        self._file = open(path, "wb")
+        self._file.write(_header(dtype, (0,) + shape))
+
+    def append(self, values: np.ndarray):
+        values = np.ascontiguousarray(values, dtype=self.dtype).reshape((-1,) + self.shape)
+        self._file.write(values.data)
+        self.length += len(values)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(_header(self.dtype, (self.length,) + self.shape))
+        self._file.close()
+
+class Writer(object):
+
+    def __init__(self, path: str, provider: Optional[str] = None):
+        # Directory of one .npy file per column:
+        # distance, duration (NaN where the query failed), mask (True where the query failed),
+        # offsets and coordinates: the path of route i is coordinates[offsets[i]:offsets[i + 1]] (empty if not computed)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.provider = provider
+        self._columns = {name: Column(os.path.join(path, name + ".npy"), dtype, shape)
+                         for name, (dtype, shape) in COLUMNS.items()}
+        self._columns["offsets"].append(np.zeros(1))
+
+    def write(self, result):
+        # Append a BatchResult (matrices are flattened row by row)
+        distance = np.ravel(result.distance)
+        directions = None if result.directions is None else np.ravel(result.directions)
+        self._write(distance, np.ravel(result.duration), np.ravel(result.mask), directions)
+
+    def write_directions(self, directions: list):
+        # Append Directions one after the other, None for the failed queries
+        mask = np.array([direction is None for direction in directions], dtype=bool)
+        distance = np.array([np.nan if d is None else d.distance for d in directions], dtype=float)
+        duration = np.array([np.nan if d is None else d.duration for d in directions], dtype=float)
+        self._write(distance, duration, mask, directions)
+
+    def _write(self, distance: np.ndarray, duration: np.ndarray, mask: np.ndarray, directions):
+        self._columns["distance"].append(distance)
+        self._columns["duration"].append(duration)
+        self._columns["mask"].append(mask)
+
+        lengths = np.zeros(len(distance), dtype=np.int64)
+        if directions is not None:
+            paths = [None if d is None else d.coordinates for d in directions]
+            for i, path in enumerate(paths):
+                if path is not None:
+                    lengths[i] = len(path)
+                    self._columns["coordinates"].append(path)
+        end = self._columns["coordinates"].length
+        self._columns["offsets"].append(end - lengths.sum() + np.cumsum(lengths))
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+        with open(os.path.join(self.path, "meta.json"), "w") as file:
+            json.dump({"provider": self.provider, "length": self._columns["distance"].length}, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Dataset(object):
+
+    def __init__(self, path: str, mmap_mode: Optional[str] = "r"):
+        # Columns written by Writer, memory-mapped (i.e., read lazily and without copies) unless mmap_mode is None
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as file:
+            self.provider = json.load(file)["provider"]
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode))
+
+    def route(self, i: int):
+        # (N,2) view of the path of route i
+        return self.coordinates[self.offsets[i]:self.offsets[i + 1]]
+
+    def __len__(self):
+        return len(self.distance)
+
+    def to_arrow(self):
+        # pyarrow Table whose "path" column is a list<fixed_size_list<double, 2>> sharing the buffers of the dataset
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("to_arrow requires pyarrow (pip install pyarrow).")
+        points = pa.FixedSizeListArray.from_arrays(pa.array(np.ravel(self.coordinates)), 2)
+        return pa.table({"distance": pa.array(self.distance, mask=np.asarray(self.mask)),
+                         "duration": pa.array(self.duration, mask=np.asarray(self.mask)),
+                         "path": pa.LargeListArray.from_arrays(pa.array(self.offsets), points)})
+
+    def to_parquet(self, path: str):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("to_parquet requires pyarrow (pip install pyarrow).")
+        pq.write_table(self.to_arrow(), path)
+
+def write(path: str, result, provider: Optional[str] = None):
+    # Export a single BatchResult
+    with Writer(path, provider) as writer:
+        writer.write(result)
+
+def load(path: str, mmap_mode: Optional[str] = "r"):
+    return Dataset(path, mmap_mode)
@@ -15,152 +15,198 @@ DECODING_TABLE = [
     36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 51
 ]
 
+# Lookup tables for the vectorized engine: characters are handled as ASCII bytes
+ENCODING_BYTES = np.frombuffer(ENCODING_TABLE.encode("ascii"), dtype=np.uint8)
+DECODING_BYTES = np.full(256, -1, dtype=np.int16)
+DECODING_BYTES[45:45 + len(DECODING_TABLE)] = DECODING_TABLE
+
 def encode(coordinates: np.array([], dtype=float), precision: int, is_list: Optional[bool] = False):
     if is_list:
-        enc_output = np.array([], dtype=str)
-        for point in coordinates:
-            line = _encode(point, precision)
-            enc_output = np.append(enc_output, line)
-    
-        return enc_output
+        # One independent polyline per point
+        return _encode_points(np.asarray(coordinates, dtype=float).reshape(-1, 2), precision)
     else:
         return _encode(coordinates, precision)
 
 def decode(encoded, is_list: Optional[bool] = False, is_here: Optional[bool] = False):
     # encoded can be str or np.array([], dtype=str)
     if is_list:
-        dec_output = np.empty((0, 2), dtype=float)
-        for line in encoded:
-            point = _decode(line, is_here)
-            dec_output = np.append(dec_output, [point], axis=0)
-        return dec_output
+        return _decode_points(encoded)
     else:
         return _decode(encoded, is_here)
 
+def encode_path(coordinates: np.ndarray, precision: int):
+    # Encode an (N,2) array of [lat, lng] into a single polyline (delta + zigzag + varint over whole arrays)
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    header = _encode_header(precision)
+
+    scaled = np.rint(coordinates * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=0)
+    values = _to_unsigned(deltas.ravel())
+
+    res = _encode_unsigned_varints(values, _varint_lengths(values))
+
+    return header + res.tobytes().decode("ascii")
+
+def decode_path(encoded: str, out: Optional[np.ndarray] = None):
+    # Decode a polyline into an (N,2) float64 array of [lat, lng]
+    # out, if given, is a preallocated (N,2) float64 array that receives the coordinates
+    decoded_values = _decode_unsigned_values(encoded)
+
+    precision, third_dim = _decode_header(decoded_values)
+    factor_degree = 10.0 ** precision
+
+    # The third dimension (e.g., elevation) is skipped, only [lat, lng] is kept
+    dims = 3 if third_dim else 2
+    decoded_values = decoded_values[2:]
+    n = decoded_values.shape[0] // dims
+    deltas = _to_signed(decoded_values[:n * dims].reshape(n, dims)[:, :2])
+
+    if out is None:
+        out = np.empty((n, 2), dtype=float)
+    elif out.shape != (n, 2) or out.dtype != np.float64:
+        raise ValueError("Output buffer must be a float64 array of shape " + str((n, 2)) + ".")
+
+    np.divide(np.cumsum(deltas, axis=0), factor_degree, out=out)
+
+    return out
+
 def _encode(coordinates: np.array([], dtype=float), precision: int):
-    # precision represents how many decimal digits of precision to store the latitude and longitude
-    multiplier_degree = 10 ** precision
+    # Encode a single [lat, lng] point
+    return encode_path(np.asarray(coordinates, dtype=float)[:2], precision)
 
-    last_lat = last_lng = 0
+def _encode_points(coordinates: np.ndarray, precision: int):
+    # Encode every point as its own polyline, sharing the header and the varint pass
+    header = _encode_header(precision)
 
-    res = np.array([], dtype=str)
-    
-    res = _encode_header(precision, res)
+    scaled = np.rint(coordinates * 10 ** precision).astype(np.int64)
+    values = _to_unsigned(scaled.ravel())
+    lengths = _varint_lengths(values)
 
-    lat = int(round(coordinates[0] * multiplier_degree))
-    res = _encode_scaled_value(lat - last_lat, res)
-    last_lat = lat
+    res = _encode_unsigned_varints(values, lengths).tobytes().decode("ascii")
 
-    lng = int(round(coordinates[1] * multiplier_degree))
-    res = _encode_scaled_value(lng - last_lng, res)
-    last_lng = lng
+    ends = np.cumsum(lengths[0::2] + lengths[1::2])
+    starts = ends - lengths[0::2] - lengths[1::2]
 
-    return "".join(res)
+    return np.array([header + res[s:e] for s, e in zip(starts.tolist(), ends.tolist())], dtype=str)
 
-def _encode_header(precision: int, res: np.array([], dtype=str)):
+def _encode_header(precision: int):
     if precision < 0 or precision > 15:
         raise ValueError("Precision is out of range.")
-    
-    res = _encode_unsigned_varint(FORMAT_VERSION, res)
-    res = _encode_unsigned_varint(precision, res)
-
-    return res
-    
-def _encode_scaled_value(value: int, res: np.array([], dtype=str)):
-    # Encode "value" into a sequence of characters
-    negative = value < 0
-
-    value = value << 1
-    if negative:
-        value = ~value
-
-    res = _encode_unsigned_varint(value, res)
-
-    return res
-
-def _encode_unsigned_varint(value: int, res: np.array([], dtype=str)):
-    # Variable integer encoding
-    while value > 0x1F:
-        pos = (value & 0x1F) | 0x20
-        res = np.append(res, ENCODING_TABLE[pos])
-        value >>= 5
-    
-    res = np.append(res, ENCODING_TABLE[value])
-    
-    return res
 
-def _decode(encoded: str, is_here: bool):
-    last_lat = last_lng = 0
+    values = np.array([FORMAT_VERSION, precision], dtype=np.uint64)
+    res = _encode_unsigned_varints(values, _varint_lengths(values))
 
-    decoded_values = np.empty(0, dtype=np.uint)
-    decoded_values = _decode_unsigned_values(encoded, decoded_values)
-    
-    precision = _decode_header(decoded_values)
-    factor_degree = 10.0 ** precision
+    return res.tobytes().decode("ascii")
+
+def _to_unsigned(values: np.ndarray):
+    # Zigzag encoding of the sign: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+def _varint_lengths(values: np.ndarray):
+    # Number of 5-bit chunks needed by each value (at most 13 for 64-bit values)
+    lengths = np.ones(values.shape, dtype=np.int64)
+    rest = values >> np.uint64(5)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(5)
+    return lengths
+
+def _encode_unsigned_varints(values: np.ndarray, lengths: np.ndarray):
+    # Variable integer encoding of a whole array, returned as ASCII bytes
+    if values.size == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    position = np.arange(lengths.max())
+    chunks = (values[:, None] >> (position * 5).astype(np.uint64)) & np.uint64(0x1F)
+    # Every chunk but the last one of a value carries the continuation bit
+    chunks |= np.where(position < lengths[:, None] - 1, np.uint64(0x20), np.uint64(0))
+
+    return ENCODING_BYTES[chunks[position < lengths[:, None]]]
 
-    decoded_values = np.delete(decoded_values, [0, 1])
+def _decode(encoded: str, is_here: bool):
+    coordinates = decode_path(encoded)
 
     if is_here:
-        coordinates = np.empty((0, 2), dtype=float)
+        # 2-dimensional array of [[lat0, lng0], [lat1, lng1], ...]
+        return coordinates
     else:
-        coordinates = np.array([], dtype=float)
-    
-    for i in range(decoded_values.shape[0]):
-        if i == len(decoded_values)-1:
-            break
-        if i%2 == 0:
-            last_lat += _to_signed(decoded_values[i])
-            last_lng += _to_signed(decoded_values[i+1]) 
-            if is_here:
-                coordinates = np.append(coordinates, [[last_lat/factor_degree, last_lng/factor_degree]], axis=0)
-            else:
-                coordinates = np.append(coordinates, [last_lat/factor_degree, last_lng/factor_degree])
-    
-    return coordinates
-
-def _decode_unsigned_values(encoded: str, decoded_values: np.array([], dtype=np.uint)):
-    result = shift = 0
-
-    for char in encoded:
-        value = _decode_char(char)
-
-        result |= (value & 0x1F) << shift
-        if (value & 0x20) == 0:
-            decoded_values = np.append(decoded_values, result)
-            result = shift = 0
-        else:
-            shift += 5
-
-    if shift > 0:
+        # 1-dimensional array of [lat0, lng0, lat1, lng1, ...]
+        return coordinates.ravel()
+
+def _decode_points(encoded):
+    # Decode a list of one-point polylines into an (N,2) array
+    if len(encoded) == 0:
+        return np.empty((0, 2), dtype=float)
+
+    lengths = np.array([len(line) for line in encoded], dtype=np.int64)
+    if lengths.min() == 0:
         raise ValueError("Invalid encoding.")
-    
-    return decoded_values
 
-def _decode_char(char: str):
-    # Decode a single char to its corresponding value
-    char_value = ord(char)
+    chars = _decode_chars("".join(encoded))
+    ends = (chars & 0x20) == 0
+    counts = np.add.reduceat(ends, np.cumsum(lengths) - lengths)
+
+    if (counts != 4).any():
+        # Not all lines hold exactly one point: decode them one by one
+        return np.array([decode_path(line)[0] for line in encoded], dtype=float)
+
+    decoded_values = _decode_unsigned_values(chars).reshape(-1, 4)
+    if (decoded_values[:, 0] != FORMAT_VERSION).any():
+        raise ValueError("Invalid format version.")
+
+    factor_degree = 10.0 ** (decoded_values[:, 1] & np.uint64(15)).astype(float)
+
+    return _to_signed(decoded_values[:, 2:]) / factor_degree[:, None]
 
+def _decode_chars(encoded: str):
+    # Decode every char to its corresponding value
     try:
-        value = DECODING_TABLE[char_value - 45]
-    except IndexError:
+        chars = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
         raise ValueError("Invalid encoding.")
-    if value < 0:
+
+    values = DECODING_BYTES[chars]
+    if (values < 0).any():
+        raise ValueError("Invalid encoding.")
+    return values
+
+def _decode_unsigned_values(encoded):
+    # encoded can be str or an array of already decoded chars
+    if isinstance(encoded, str):
+        encoded = _decode_chars(encoded)
+
+    if encoded.size == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    ends = (encoded & 0x20) == 0
+    if not ends[-1]:
+        raise ValueError("Invalid encoding.")
+
+    # Start of every value and position of every char inside its value
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    group = np.cumsum(ends) - ends
+    position = np.arange(encoded.size) - starts[group]
+
+    chunks = (encoded & 0x1F).astype(np.uint64) << (position * 5).astype(np.uint64)
+
+    return np.add.reduceat(chunks, starts)
+
+def _decode_header(decoded_values: np.array([], dtype=np.uint64)):
+    if decoded_values.shape[0] < 2:
         raise ValueError("Invalid encoding.")
-    return value
 
-def _decode_header(decoded_values: np.array([], dtype=np.uint)):
     version = decoded_values[0]
     if version != FORMAT_VERSION:
         raise ValueError("Invalid format version.")
-    
-    value = decoded_values[1]
+
+    value = int(decoded_values[1])
     precision = value & 15
+    third_dim = (value >> 4) & 7
 
-    return precision
+    return precision, third_dim
 
-def _to_signed(value: int):
-    # Decode the sign of an unsigned value
-    if value & 1:
-        value = ~value
-    value >>= 1
-    return value
\ No newline at end of file
+def _to_signed(values: np.ndarray):
+    # Decode the sign of unsigned values
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
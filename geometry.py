@@ -0,0 +1,196 @@
+import numpy as np
+
+# Mean radius of the Earth in metres
+EARTH_RADIUS = 6371008.8
+# Semi-major axis (m) and flattening of the WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+def haversine(lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray):
+    # Great-circle distance in metres on the mean sphere, coordinates in degrees
+    lat1, lng1, lat2, lng2 = np.radians(lat1), np.radians(lng1), np.radians(lat2), np.radians(lng2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def vincenty(lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray, iterations: int = 100,
+             tolerance: float = 1e-12):
+    # Geodesic distance in metres on the WGS84 ellipsoid (inverse formula of Vincenty), coordinates in degrees
+    # The pairs that do not converge (nearly antipodal points) fall back to the haversine distance
+    lat1, lng1, lat2, lng2 = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (lat1, lng1, lat2, lng2)))
+    a, f = WGS84_A, WGS84_F
+    b = (1 - f) * a
+    L = np.radians(lng2 - lng1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1, sinU2, cosU2 = np.sin(U1), np.cos(U1), np.sin(U2), np.cos(U2)
+
+    lam = L
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(all="ignore"):
+        for _ in range(iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            # Coincident points have sin_sigma = 0 and equatorial lines cos2_alpha = 0
+            sin_alpha = np.where(sin_sigma > 0, cosU1 * cosU2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha > 0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha, 0.0)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma * (
+                cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            converged = np.abs(lam - previous) <= tolerance
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) - B / 6 *
+                                       cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distance = b * A * (sigma - delta_sigma)
+    return np.where(converged, distance, haversine(lat1, lng1, lat2, lng2))
+
+METHODS = {"haversine": haversine, "vincenty": vincenty}
+
+def _method(method: str):
+    if method not in METHODS:
+        raise ValueError("Unknown distance method: " + str(method))
+    return METHODS[method]
+
+def segment_lengths(path: np.ndarray, method: str = "haversine"):
+    # Length in metres of each of the N-1 segments of an (N,2) array of [lat, lng]
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    if method == "haversine":
+        # The cosines of the latitudes are shared by consecutive segments
+        lat = np.radians(path[:, 0])
+        lng = np.radians(path[:, 1])
+        cos = np.cos(lat)
+        a = np.sin(np.diff(lat) / 2) ** 2 + cos[:-1] * cos[1:] * np.sin(np.diff(lng) / 2) ** 2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return _method(method)(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+
+def cumulative_distance(path: np.ndarray, method: str = "haversine"):
+    # (N,) distance in metres from the first point to each point along the path
+    return np.concatenate(([0.0], np.cumsum(segment_lengths(path, method))))
+
+def length(path: np.ndarray, method: str = "haversine"):
+    return float(segment_lengths(path, method).sum())
+
+def bbox(path: np.ndarray):
+    # [min_lat, min_lng, max_lat, max_lng] of the path, NaN if it is empty
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    if path.shape[0] == 0:
+        return np.full(4, np.nan)
+    return np.concatenate((path.min(axis=0), path.max(axis=0)))
+
+class Nearest(object):
+
+    __slots__ = ("segment", "fraction", "coordinates", "distance", "along")
+
+    def __init__(self, segment: np.ndarray, fraction: np.ndarray, coordinates: np.ndarray, distance: np.ndarray,
+                 along: np.ndarray):
+        # Index of the closest segment of the path to each point, and position of the projection on that
+        # segment (0 at its start, 1 at its end)
+        self.segment = segment
+        self.fraction = fraction
+        # (M,2) array of the closest [lat, lng] on the path
+        self.coordinates = coordinates
+        # Distance in metres of each point to the path, and distance along the path to its projection
+        self.distance = distance
+        self.along = along
+
+def nearest(path: np.ndarray, points: np.ndarray, chunk: int = 1 << 20):
+    # Closest point of the path to each of the (M,2) points, in an equirectangular projection around each point
+    # The (M,N) distances are computed by blocks of at most "chunk" values
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if path.shape[0] == 0:
+        raise ValueError("The path is empty.")
+    m = points.shape[0]
+    segment = np.zeros(m, dtype=np.int64)
+    fraction = np.zeros(m, dtype=float)
+
+    if path.shape[0] > 1:
+        lat, lng = np.radians(path[:, 0]), np.radians(path[:, 1])
+        step = max(chunk // (path.shape[0] - 1), 1)
+        for start in range(0, m, step):
+            block = np.radians(points[start:start + step])
+            scale = np.cos(block[:, :1])
+            # Coordinates of the vertices relative to each point, in radians of arc: (M,N)
+            x = (lng[None, :] - block[:, 1:]) * scale
+            y = lat[None, :] - block[:, :1]
+            vx, vy = np.diff(x, axis=1), np.diff(y, axis=1)
+            norm = vx * vx + vy * vy
+            t = np.clip(-(x[:, :-1] * vx + y[:, :-1] * vy) / np.where(norm > 0, norm, 1.0), 0.0, 1.0)
+            closest = np.argmin((x[:, :-1] + t * vx) ** 2 + (y[:, :-1] + t * vy) ** 2, axis=1)
+            segment[start:start + step] = closest
+            fraction[start:start + step] = t[np.arange(closest.shape[0]), closest]
+
+    end = np.minimum(segment + 1, path.shape[0] - 1)
+    coordinates = path[segment] + fraction[:, None] * (path[end] - path[segment])
+    lengths = segment_lengths(path)
+    along = np.concatenate(([0.0], np.cumsum(lengths)))[segment]
+    if lengths.shape[0] > 0:
+        along = along + fraction * lengths[np.minimum(segment, lengths.shape[0] - 1)]
+    return Nearest(segment, fraction, coordinates,
+                   haversine(points[:, 0], points[:, 1], coordinates[:, 0], coordinates[:, 1]), along)
+
+# Batches of R routes are packed as an (M,2) array of coordinates and (R+1,) offsets, the path of route i being
+# coordinates[offsets[i]:offsets[i + 1]], as in the columns of export.Dataset
+
+def pack(paths: list):
+    # Missing paths (None) are packed as empty routes
+    paths = [np.empty((0, 2)) if path is None else np.asarray(path, dtype=float).reshape(-1, 2) for path in paths]
+    offsets = np.concatenate(([0], np.cumsum([path.shape[0] for path in paths]))).astype(np.int64)
+    coordinates = np.concatenate(paths) if paths else np.empty((0, 2))
+    return coordinates, offsets
+
+def unpack(coordinates: np.ndarray, offsets: np.ndarray):
+    # Views of the paths of each route
+    return [coordinates[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def _packed_segments(coordinates: np.ndarray, offsets: np.ndarray, method: str):
+    # Lengths of the M-1 segments between consecutive coordinates, 0 for those that join two routes
+    lengths = segment_lengths(coordinates, method)
+    boundaries = np.asarray(offsets[1:-1])
+    boundaries = boundaries[(boundaries > 0) & (boundaries < coordinates.shape[0])]
+    lengths[boundaries - 1] = 0.0
+    return lengths
+
+def batch_cumulative_distance(coordinates: np.ndarray, offsets: np.ndarray, method: str = "haversine"):
+    # (M,) distance in metres from the first point of its route to each point
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    total = np.concatenate(([0.0], np.cumsum(_packed_segments(coordinates, offsets, method))))
+    counts = np.diff(offsets)
+    return total - np.repeat(total[np.minimum(offsets[:-1], max(total.shape[0] - 1, 0))], counts)
+
+def batch_length(coordinates: np.ndarray, offsets: np.ndarray, method: str = "haversine"):
+    # (R,) length in metres of each route, 0 for the routes with less than 2 points
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    total = np.concatenate(([0.0], np.cumsum(_packed_segments(coordinates, offsets, method))))
+    start, end = offsets[:-1], offsets[1:]
+    empty = end == start
+    return np.where(empty, 0.0, total[np.where(empty, 0, end - 1)] - total[np.where(empty, 0, start)])
+
+def batch_bbox(coordinates: np.ndarray, offsets: np.ndarray):
+    # (R,4) [min_lat, min_lng, max_lat, max_lng] of each route, NaN for the empty routes
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    boxes = np.full((offsets.shape[0] - 1, 4), np.nan)
+    filled = np.flatnonzero(np.diff(offsets) > 0)
+    if filled.shape[0] > 0:
+        # reduceat over the starts of the non-empty routes, each run ends at the start of the next one
+        starts = offsets[filled]
+        boxes[filled, :2] = np.minimum.reduceat(coordinates, starts, axis=0)
+        boxes[filled, 2:] = np.maximum.reduceat(coordinates, starts, axis=0)
+    return boxes
+
+def speeds(path: np.ndarray, durations: np.ndarray, method: str = "haversine"):
+    # Speed in m/s of each segment, given the (N-1,) duration in seconds of each segment (NaN when 0)
+    durations = np.asarray(durations, dtype=float)
+    with np.errstate(all="ignore"):
+        return np.where(durations > 0, segment_lengths(path, method) / durations, np.nan)
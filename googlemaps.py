@@ -1,38 +1,76 @@
 from pathlib import Path
 from typing import Optional
 from client import Client
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _seconds(duration: str):
+    # Durations are strings in seconds (e.g., "165s", "3.5s")
+    return round(float(duration.rstrip("s")))
+
+def _path(legs: list):
+    path = []
+    for node in [step for leg in legs for step in leg["steps"]]:
+        # TODO
+        # Option 1
+        lat = node["polyline"]["geoJsonLinestring"]["latitude"]
+        # Option 2
+        lat = node["end_location"]["latLng"]["latitude"]
+        # Option 1
+        lng = node["polyline"]["geoJsonLinestring"]["longitude"]
+        # Option 2
+        lng = node["end_location"]["latLng"]["longitude"]
+        # After you understood which is correct, set X-Goog-FieldMask to: "routes.legs.steps.polyline.geoJsonLinestring" or "routes.legs.steps.end_location"
+        path.append([lat, lng])
+    return np.array(path, dtype=float)
+
 class GoogleMaps(Expert):
 
+    # Origin, destination and up to 25 intermediates
+    max_waypoints = 27
+
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://routes.googleapis.com/directions/v2:computeRoutes"
-        self.client = Client(base_url=self.base_url)
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The fields of the body that do not depend on the waypoints and departure are built once
+        self._template = self._static_params()
+        self._headers = {"Content-Type": "application/json",
+                         "X-Goog-Api-Key": self.key,
+                         "X-Goog-FieldMask": "routes.duration,routes.distanceMeters,routes.legs.distanceMeters,"
+                                             "routes.legs.duration,routes.legs.steps"}
 
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+    @staticmethod
+    def _static_params():
         # For more information, visit https://developers.google.com/maps/documentation/routes/reference/rest/v2/TopLevel/computeRoutes
 
-        key = self.key
-        
         params = {}
-        params["origin"]["location"]["latLng"]["latitude"] = str(source[0])
-        params["origin"]["location"]["latLng"]["longitude"] = str(source[1])
-        params["destination"]["location"]["latLng"]["latitude"] = str(destination[0])
-        params["destination"]["location"]["latLng"]["longitude"] = str(destination[1])
         params["travelMode"] = "DRIVE"
         params["routingPreference"] = "TRAFFIC_AWARE_OPTIMAL"
         params["computeAlternativeRoutes"] = "false"
         params["units"] = "METRIC"
-        params["polylineQuality"] = "HIGH_QUALITY",
+        params["polylineQuality"] = "HIGH_QUALITY"
         params["polylineEncoding"] = "GEO_JSON_LINESTRING"
 
+        return params
+
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        # The body is sent as JSON, the coordinates are converted to floats at once
+        points = waypoints.tolist()
+        params = dict(self._template)
+        params["origin"] = {"location": {"latLng": {"latitude": points[0][0], "longitude": points[0][1]}}}
+        params["destination"] = {"location": {"latLng": {"latitude": points[-1][0], "longitude": points[-1][1]}}}
+        if len(points) > 2:
+            params["intermediates"] = [{"location": {"latLng": {"latitude": p[0], "longitude": p[1]}}}
+                                       for p in points[1:-1]]
+
         if compute_path:
             # TODO
             # Probably, you need to modify X-Goog-FieldMask
@@ -42,36 +80,77 @@ class GoogleMaps(Expert):
         if departure:
             params["departureTime"] = departure
 
-        return self._parse_request(self.client.request_post(base_url=self.base_url, params=params, 
-                                                       headers={"Content-Type": "application/json",
-                                                               "X-Goog-Api-Key": key,
-                                                               "X-Goog-FieldMask": "routes.duration,routes.distanceMeters,routes.legs.steps"}), compute_path)
+        return "POST", self.base_url, params, self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
         try:  
             distance = response["routes"][0]["distanceMeters"]
-            duration = response["routes"][0]["duration"]
+            duration = _seconds(response["routes"][0]["duration"])
+
+            # There is a leg between each pair of consecutive waypoints
+            legs = response["routes"][0].get("legs", [])
+            leg_distances = [leg["distanceMeters"] for leg in legs] or None
+            leg_durations = [_seconds(leg["duration"]) for leg in legs] or None
         
             if compute_path:
-                path = np.array([], dtype = str)
-                for node in response["routes"][0]["legs"][0]["steps"]:
-                    # TODO
-                    # Option 1
-                    lat = node["polyline"]["geoJsonLinestring"]["latitude"]
-                    # Option 2
-                    lat = node["end_location"]["latLng"]["latitude"]
-                    # Option 1
-                    lng = node["polyline"]["geoJsonLinestring"]["longitude"]
-                    # Option 2
-                    lng = node["end_location"]["latLng"]["longitude"]
-                    # After you understood which is correct, set X-Goog-FieldMask to: "routes.legs.steps.polyline.geoJsonLinestring" or "routes.legs.steps.end_location"
-                    path = np.append(path, fp.encode(np.array([lat, lng], dtype=float), 6, False))
-                return Direction(distance, duration, path)
+                # The steps are read on the first access to the path
+                return Direction(distance, duration, legs, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
         except:
             Path("googlemaps.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())
             print("Please visit: https://cloud.google.com/apis/design/errors")
-            return None
\ No newline at end of file
+            return None
+
+class GoogleMapsMatrix(MatrixExpert):
+
+    # TRAFFIC_AWARE_OPTIMAL accepts up to 100 elements per request
+    max_origins = 50
+    max_destinations = 50
+    max_cells = 100
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://routes.googleapis.com/distanceMatrix/v2:computeRouteMatrix"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://developers.google.com/maps/documentation/routes/reference/rest/v2/TopLevel/computeRouteMatrix
+
+        # The body is sent as JSON
+        params = {}
+        params["origins"] = [{"waypoint": {"location": {"latLng": {"latitude": float(p[0]), "longitude": float(p[1])}}}}
+                             for p in sources]
+        params["destinations"] = [{"waypoint": {"location": {"latLng": {"latitude": float(p[0]), "longitude": float(p[1])}}}}
+                                  for p in destinations]
+        params["travelMode"] = "DRIVE"
+        params["routingPreference"] = "TRAFFIC_AWARE_OPTIMAL"
+
+        # RFC 3339-format in UTC (e.g., 2014-10-02T15:01:23Z)
+        if departure:
+            params["departureTime"] = departure
+
+        return "POST", self.base_url, params, {"Content-Type": "application/json",
+                                              "X-Goog-Api-Key": self.key,
+                                              "X-Goog-FieldMask": "originIndex,destinationIndex,duration,distanceMeters,condition"}
+
+    @staticmethod
+    def _parse_request(response: list, shape: tuple):
+        try:
+            distance = np.full(shape, np.nan, dtype=float)
+            duration = np.full(shape, np.nan, dtype=float)
+
+            # The response is a list of elements, one for each cell
+            for element in response:
+                if element.get("condition") == "ROUTE_EXISTS":
+                    distance[element.get("originIndex", 0), element.get("destinationIndex", 0)] = element.get("distanceMeters", 0)
+                    duration[element.get("originIndex", 0), element.get("destinationIndex", 0)] = _seconds(element["duration"])
+
+            return distance, duration
+        except:
+            Path("googlemaps_matrix.json").write_text(json.dumps(response, indent=4))
+            print(traceback.format_exc())
+            print("Please visit: https://cloud.google.com/apis/design/errors")
+            return None
@@ -1,27 +1,36 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
 import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _path(polylines: list):
+    # path is a 2-dimensional array of [[lat0, lng0], [lat1, lng1], ...]
+    return np.concatenate([fp.decode_path(polyline) for polyline in polylines])
+
 class Here(Expert):
 
+    max_waypoints = 200
+
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://router.hereapi.com/v8/routes"
-        self.client = Client(base_url=self.base_url)
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/json"}
 
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+    def _static_params(self, compute_path: bool):
         # For more information, visit https://developer.here.com/documentation/routing-api/api-reference-swagger.html
 
         params = {}
-        params["origin"] = str(source[0])+","+str(source[1])
-        params["destination"] = str(destination[0])+","+str(destination[1])
         params["apiKey"] = self.key
         params["transportMode"] = "car"
         params["routingMode"] = "fast"
@@ -31,38 +40,89 @@ class Here(Expert):
         else:
             params["return"] = "travelSummary"
 
+        return params
+
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        points = waypoints.tolist()
+
+        query = "origin=" + QUERY_POINT % tuple(points[0]) + "&destination=" + QUERY_POINT % tuple(points[-1])
+        # Repeated parameter, one for each intermediate waypoint
+        query += "".join("&via=" + QUERY_POINT % tuple(p) for p in points[1:-1])
+
         if departure:
             # RFC 3339-format (e.g., 1996-12-19T16:39:57, 1996-12-19T16:39:57-08:00)
-            params["departureTime"] = departure
+            query += "&departureTime=" + quote_value(departure)
         
-        return self._parse_request(self.client.request_get(base_url=self.base_url, params=params,
-                                                           headers={"Content-Type": "application/json"}), compute_path)
+        return "GET", self.base_url, query + "&" + self._templates[bool(compute_path)], self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
         try:  
-            distance = response["routes"][0]["sections"][0]["travelSummary"]["length"]
-            duration = response["routes"][0]["sections"][0]["travelSummary"]["duration"]
+            # There is a section for each leg between two waypoints
+            sections = response["routes"][0]["sections"]
+            leg_distances = [section["travelSummary"]["length"] for section in sections]
+            leg_durations = [section["travelSummary"]["duration"] for section in sections]
+            distance = sum(leg_distances)
+            duration = sum(leg_durations)
 
             if compute_path:
-                polyline = response["routes"][0]["sections"][0]["polyline"]
-                # polyline is a single string that encoded the entire path
-                points = fp.decode(polyline, is_here=True)
-                # points is a 2-dimensional array of [[lat0, lng0], [lat1, lng1], ...]
+                # Each section has a single string that encoded its entire path, decoded on the first access
+                polylines = [section["polyline"] for section in sections]
 
-                path = np.array([], dtype=str)
-                for node in points:
-                    lat = node[0]
-                    lng = node[1]
-                    enc_node = fp.encode(np.array([lat, lng], dtype=float), 6)
-                    path = np.append(path, enc_node)
-
-                # path is a 1-dimensional array of polylines [polyline0, polyline1, ...]
-
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, polylines, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
         except:
             Path("here.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())           
-            return None
\ No newline at end of file
+            return None
+
+class HereMatrix(MatrixExpert):
+
+    # Synchronous requests over the whole world
+    max_origins = 15
+    max_destinations = 100
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://matrix.router.hereapi.com/v8/matrix"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://www.here.com/docs/bundle/matrix-routing-api-v8-api-reference/page/index.html
+
+        url = self.base_url+"?"+"async=false&apiKey="+self.key
+
+        # The body is sent as JSON
+        params = {}
+        params["origins"] = [{"lat": float(p[0]), "lng": float(p[1])} for p in sources]
+        params["destinations"] = [{"lat": float(p[0]), "lng": float(p[1])} for p in destinations]
+        params["regionDefinition"] = {"type": "world"}
+        params["matrixAttributes"] = ["travelTimes", "distances"]
+        params["transportMode"] = "car"
+        params["routingMode"] = "fast"
+
+        if departure:
+            # RFC 3339-format (e.g., 1996-12-19T16:39:57, 1996-12-19T16:39:57-08:00)
+            params["departureTime"] = departure
+
+        return "POST", url, params, {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _parse_request(response: dict, shape: tuple):
+        try:
+            # Flat arrays in row-major order (origin by origin)
+            distance = np.array(response["matrix"]["distances"], dtype=float).reshape(shape)
+            duration = np.array(response["matrix"]["travelTimes"], dtype=float).reshape(shape)
+
+            if "errorCodes" in response["matrix"]:
+                failed = np.array(response["matrix"]["errorCodes"]).reshape(shape) != 0
+                distance[failed] = np.nan
+                duration[failed] = np.nan
+
+            return distance, duration
+        except:
+            Path("here_matrix.json").write_text(json.dumps(response, indent=4))
+            print(traceback.format_exc())
+            return None
@@ -1,47 +1,59 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _path(points: list):
+    # points is an array of [[lng1, lat1], [lng2, lat2], ...]
+    return np.asarray(points, dtype=float).reshape(-1, 2)[:, ::-1]
+
 class Mapbox(Expert):
 
+    max_waypoints = 25
+    path_key = "coordinates"
+
     def __init__(self, key: str):
         self.key = key
         
         # driving-traffic enables the trafficMode
         self.base_url = "https://api.mapbox.com/directions/v5/mapbox/driving-traffic"
-        self.client = Client(base_url=self.base_url)
-    
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False): 
-        # For more information, visit https://docs.mapbox.com/api/navigation/directions/ and https://docs.mapbox.com/api/navigation/http-post/
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
 
-        url = self.base_url+"?"+"access_token="+self.key
-        
-        # [lng, lat]-format 
-        str_source = str(source[1])+","+str(source[0])
-        str_destination = str(destination[1])+","+str(destination[0])
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-        params = {}
-        params["coordinates"] = str_source+";"+str_destination
+    @staticmethod
+    def _static_params(compute_path: bool):
+        # For more information, visit https://docs.mapbox.com/api/navigation/directions/ and https://docs.mapbox.com/api/navigation/http-post/
 
+        params = {}
         if compute_path:
             params["geometries"] = "geojson"
             params["overview"] = "full"
         else:
             params["overview"] = "false"
 
+        return params
+    
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False): 
+        url = self.base_url+"?"+"access_token="+self.key
+        
+        # [lng, lat]-format, sent as an encoded form
+        body = "coordinates=" + "%3B".join(QUERY_POINT % (p[1], p[0]) for p in waypoints.tolist())
+
         if departure:
             # ISO 8601-format (e.g, 2023-10-31T10:37)
-            params["depart_at"] = departure
+            body += "&depart_at=" + quote_value(departure)
         
-        return self._parse_request(self.client.request_post(full_url=url, params=params,
-                                                            headers={"Content-Type": "application/x-www-form-urlencoded"}), compute_path)
+        return "POST", url, body + "&" + self._templates[bool(compute_path)], self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -50,21 +62,61 @@ class Mapbox(Expert):
             distance = round(response["routes"][0]["distance"])
             duration = round(response["routes"][0]["duration"])
 
+            # There is a leg between each pair of consecutive waypoints
+            legs = response["routes"][0].get("legs", [])
+            leg_distances = [round(leg["distance"]) for leg in legs] or None
+            leg_durations = [round(leg["duration"]) for leg in legs] or None
+
             if compute_path:
-                path = np.array([], dtype=str)
-                points = np.array(response["routes"][0]["geometry"]["coordinates"], dtype=float)
-                # points is an array of [[lng1, lat1], [lng2, lat2], ...]
-                
-                for p in points:
-                    lat = p[1]
-                    lng = p[0]
-                    enc_node = fp.encode(np.array([lat, lng], dtype=float), 6)
-                    path = np.append(path, enc_node)
+                # Decoded on the first access to the path
+                points = response["routes"][0]["geometry"]["coordinates"]
             
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, points, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
+        except:
+            Path("mapbox.json").write_text(json.dumps(response, indent=4, default=lambda array: array.tolist()))
+            print(traceback.format_exc())
+            return None
+
+class MapboxMatrix(MatrixExpert):
+
+    # driving-traffic accepts up to 10 coordinates per request (sources and destinations)
+    max_origins = 5
+    max_destinations = 5
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://api.mapbox.com/directions-matrix/v1/mapbox/driving-traffic/"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://docs.mapbox.com/api/navigation/matrix/
+
+        # [lng, lat]-format, the sources come first and then the destinations
+        url = self.base_url+";".join(str(p[1])+","+str(p[0]) for p in np.concatenate((sources, destinations)))
+
+        params = {}
+        params["access_token"] = self.key
+        params["sources"] = ";".join(str(i) for i in range(sources.shape[0]))
+        params["destinations"] = ";".join(str(sources.shape[0] + i) for i in range(destinations.shape[0]))
+        params["annotations"] = "distance,duration"
+
+        if departure:
+            # ISO 8601-format (e.g, 2023-10-31T10:37)
+            params["depart_at"] = departure
+
+        return "GET", url, params, {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _parse_request(response: dict, shape: tuple):
+        try:
+            # Cells without a route are null
+            distance = np.round(np.array(response["distances"], dtype=float).reshape(shape))
+            duration = np.round(np.array(response["durations"], dtype=float).reshape(shape))
+
+            return distance, duration
         except:
-            Path("mapbox.json").write_text(json.dumps(response, indent=4))
+            Path("mapbox_matrix.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())
-            return None
\ No newline at end of file
+            return None
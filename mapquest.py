@@ -1,27 +1,35 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, QUERY_POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
 import numpy as np
 import json
 import traceback
 
+def _path(points: list):
+    points = np.array(points, dtype=float)
+    # We have an array of [lat1, lng1, lat2, lng2, ...]
+    return points[:points.shape[0] // 2 * 2].reshape(-1, 2)
+
 class MapQuest(Expert):
+
+    max_waypoints = 25
     
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://www.mapquestapi.com/directions/v2/route"
-        self.client = Client(base_url=self.base_url)
-    
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/json"}
+
+    def _static_params(self, compute_path: bool):
         # For more information, visit https://developer.mapquest.com/documentation/directions-api/route/get
-        
-        params = {} 
-        params["from"] = str(source[0])+","+str(source[1])
-        params["to"] = str(destination[0])+","+str(destination[1])
+
+        params = {}
         params["key"] = self.key
         params["ambiguities"] ="ignore"
         params["doReverseGeocode"] = "false"
@@ -30,7 +38,6 @@ class MapQuest(Expert):
         params["manMaps"] = "false"
         params["routeType"] = "fastest"
         params["shapeFormat"] = "raw"
-        params["timeType"] = "1"
         params["useTraffic"] = "true"
 
         if compute_path:
@@ -38,13 +45,23 @@ class MapQuest(Expert):
         else:
             params["fullShape"] = "false"            
 
+        return params
+    
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
+        points = waypoints.tolist()
+
+        query = "from=" + QUERY_POINT % tuple(points[0])
+        # Repeated parameter, the route visits every "to" in order
+        query += "".join("&to=" + QUERY_POINT % tuple(p) for p in points[1:])
+
         if departure:
-            params["timeType"] = "2"
             # ISO 8601-format (e.g, 2023-10-31T10:37)
-            params["isoLocal"] = departure
+            query += "&timeType=2&isoLocal=" + quote_value(departure)
+        else:
+            query += "&timeType=1"
 
-        return self._parse_request(self.client.request_get(base_url=self.base_url, params=params,
-                                                           headers={"Content-Type": "application/json"}), compute_path)
+        return "GET", self.base_url, query + "&" + self._templates[bool(compute_path)], self._headers
     
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -53,23 +70,19 @@ class MapQuest(Expert):
             # From Km to m
             distance = round(distance * 1000)
             duration = response["route"]["realTime"]
+
+            # There is a leg between each pair of consecutive waypoints
+            legs = response["route"].get("legs", [])
+            leg_distances = [round(leg["distance"] * 1000) for leg in legs] or None
+            leg_durations = [leg.get("realTime", leg["time"]) for leg in legs] or None
             
             if compute_path:
-                points = np.array(response["route"]["shape"]["shapePoints"], dtype=float)
-                # We have an array of [lat1, lng1, lat2, lng2, ...]
-                path = np.array([], dtype = str)
-                for i in range(points.shape[0]):
-                    if i == len(points)-1:
-                        break
-                    elif i%2 == 0:
-                        lat = points[i]
-                        lng = points[i+1]
-                        enc_node = fp.encode(np.array([lat, lng], dtype=float), 6)
-                        path = np.append(path, enc_node)
+                # Decoded on the first access to the path
+                points = response["route"]["shape"]["shapePoints"]
                 
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, points, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
         except:
             Path("mapquest.json").write_text(json.dumps(response, indent=4))
             print(traceback.format_exc())
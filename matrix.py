@@ -0,0 +1,79 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from batch import BatchResult
+from ratelimit import TokenBucket
+import numpy as np
+
+class MatrixExpert(ABC):
+
+    # Maximum number of origins, destinations and cells (origins x destinations) of a single request
+    max_origins = 10
+    max_destinations = 10
+    max_cells = None
+
+    @abstractmethod
+    def __init__(self, key: str):
+        pass
+
+    @property
+    def name(self):
+        # Name of the provider (e.g., "HereMatrix", "TomTomMatrix")
+        return type(self).__name__
+
+    def _tiles(self, m: int, n: int):
+        # Split an M x N matrix into tiles that fit the limits of the provider
+        cols = min(n, self.max_destinations, self.max_cells or n)
+        rows = min(m, self.max_origins, (self.max_cells // cols) if self.max_cells else m)
+        return [(r, min(r + rows, m), c, min(c + cols, n)) for r in range(0, m, rows) for c in range(0, n, cols)]
+
+    def _query_tile(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str],
+                    bucket: Optional[TokenBucket]):
+        if bucket is not None:
+            bucket.acquire()
+        method, url, params, headers = self._build_request(sources, destinations, departure)
+        return self._parse_request(self.client.request(method, url, params, headers), (sources.shape[0], destinations.shape[0]))
+
+    def matrix(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None,
+               max_workers: int = 4, bucket: Optional[TokenBucket] = None):
+        # Distances (m) and durations (s) from each of the (M,2) sources to each of the (N,2) destinations
+        # The tiles are requested in parallel and stitched into (M,N) arrays, NaN where a cell failed
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        m, n = sources.shape[0], destinations.shape[0]
+
+        distance = np.full((m, n), np.nan, dtype=float)
+        duration = np.full((m, n), np.nan, dtype=float)
+        if m == 0 or n == 0:
+            return BatchResult(distance, duration, np.isnan(distance), None)
+
+        tiles = self._tiles(m, n)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tiles))) as executor:
+            results = executor.map(lambda t: self._query_tile(sources[t[0]:t[1]], destinations[t[2]:t[3]], departure, bucket),
+                                   tiles)
+            for (r0, r1, c0, c1), result in zip(tiles, results):
+                if result is not None:
+                    distance[r0:r1, c0:c1], duration[r0:r1, c0:c1] = result
+
+        return BatchResult(distance, duration, np.isnan(distance) | np.isnan(duration), None)
+
+    @abstractmethod
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # sources and destinations are (M,2) and (N,2) arrays of [lat, lng] that fit in one request
+        # Return the (method, url, params, headers) of the request
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def _parse_request(response: dict, shape: tuple):
+        # Return the (M,N) arrays of distances (m) and durations (s), NaN where a cell failed, or None
+        pass
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
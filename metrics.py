@@ -0,0 +1,166 @@
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Optional
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the latency histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Provider and span of the query being run by the current thread or task
+_provider = ContextVar("ospra_provider", default=None)
+_span = ContextVar("ospra_span", default=None)
+
+class Histogram(object):
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Span(object):
+
+    __slots__ = ("registry", "name", "provider", "trace_id", "span_id", "parent_id", "start", "start_ns", "_tokens")
+
+    def __init__(self, registry, name: str, provider: Optional[str] = None):
+        self.registry = registry
+        self.name = name
+        self.provider = provider
+
+    def __enter__(self):
+        parent = _span.get()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = os.urandom(8).hex()
+        if self.provider is None:
+            self.provider = _provider.get()
+            self._tokens = (_span.set(self), None)
+        else:
+            self._tokens = (_span.set(self), _provider.set(self.provider))
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _span.reset(self._tokens[0])
+        if self._tokens[1] is not None:
+            _provider.reset(self._tokens[1])
+        self.registry._finish(self, elapsed, exc is None)
+
+class _NoopSpan(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NOOP = _NoopSpan()
+
+class Registry(object):
+
+    def __init__(self, max_spans: int = 10000):
+        # Disabled by default: timers are a shared no-op and counters return immediately
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        # Finished spans, in OpenTelemetry-style dicts
+        self.spans = deque(maxlen=max_spans)
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        # hook is called with every finished span (e.g., to forward it to a tracing backend)
+        self.hooks.append(hook)
+
+    def timer(self, stage: str, provider: Optional[str] = None):
+        # Time a stage (e.g., "url", "network", "decode", "parse") of the current provider
+        if not self.enabled:
+            return NOOP
+        return Span(self, stage, provider)
+
+    def count(self, name: str, value: float = 1, provider: Optional[str] = None):
+        # Increment a counter (e.g., "received_bytes", "retries", "cache_hits") of the current provider
+        if not self.enabled:
+            return
+        key = (provider or _provider.get() or "", name)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def _finish(self, span: Span, elapsed: float, ok: bool):
+        key = (span.provider or "", span.name)
+        record = {"name": span.name,
+                  "trace_id": span.trace_id,
+                  "span_id": span.span_id,
+                  "parent_span_id": span.parent_id,
+                  "start_time_unix_nano": span.start_ns,
+                  "end_time_unix_nano": span.start_ns + int(elapsed * 1e9),
+                  "status": "OK" if ok else "ERROR",
+                  "attributes": {"provider": span.provider}}
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(elapsed)
+            self.spans.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.spans.clear()
+
+    def prometheus(self):
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            if self.histograms:
+                lines.append("# HELP ospra_stage_seconds Latency of each stage of a query.")
+                lines.append("# TYPE ospra_stage_seconds histogram")
+            for (provider, stage), histogram in sorted(self.histograms.items()):
+                labels = 'provider="' + provider + '",stage="' + stage + '"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append("ospra_stage_seconds_bucket{" + labels + ',le="' + le + '"} ' + str(cumulative))
+                lines.append("ospra_stage_seconds_sum{" + labels + "} " + repr(histogram.sum))
+                lines.append("ospra_stage_seconds_count{" + labels + "} " + str(histogram.count))
+
+            for name in sorted(set(name for _, name in self.counters)):
+                lines.append("# TYPE ospra_" + name + "_total counter")
+                for (provider, counter), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append("ospra_" + name + '_total{provider="' + provider + '"} ' + repr(value))
+
+        return "\n".join(lines) + "\n"
+
+# Registry used by Client, Expert and the caches
+registry = Registry()
+
+def enable():
+    registry.enabled = True
+
+def disable():
+    registry.enabled = False
+
+def timer(stage: str, provider: Optional[str] = None):
+    return registry.timer(stage, provider)
+
+def count(name: str, value: float = 1, provider: Optional[str] = None):
+    registry.count(name, value, provider)
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Optional, Union
+from abstract import Expert
+import numpy as np
+import threading
+import time
+
+# Seconds between two checks of the queries still waiting for a thread of the executor
+QUEUE_POLL = 0.01
+
+class Result(object):
+
+    __slots__ = ("provider", "direction", "elapsed", "error")
+
+    def __init__(self, provider: str, direction=None, elapsed: float = 0.0, error: Optional[BaseException] = None):
+        self.provider = provider
+        # None if the provider failed or timed out
+        self.direction = direction
+        # Wall-clock time in seconds
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.direction is not None
+
+class Orchestrator(object):
+
+    def __init__(self, experts: list, timeout: Optional[Union[float, dict]] = None, max_workers: Optional[int] = None,
+                 alpha: float = 0.2):
+        self.experts = list(experts)
+        # timeout in seconds, either for every provider or as {"Here": 2.0, "TomTom": 1.5, ...}
+        self.timeout = timeout
+        # Abandoned queries keep their thread until they complete, so by default there is room for a second round
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or max(2 * len(self.experts), 1))
+
+        # Exponentially weighted moving averages of the latency of the successful queries of each provider, in seconds,
+        # and of its success rate; abandoned queries are still observed when they complete
+        self.alpha = alpha
+        self.latency = {}
+        self.success = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _provider(expert: Expert):
+        return expert.name
+
+    def _timeout(self, expert: Expert):
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(self._provider(expert))
+        return self.timeout
+
+    def _observe(self, result: Result):
+        with self._lock:
+            # How fast a provider fails says nothing about how fast it answers, so failures only lower its success rate
+            previous = self.success.get(result.provider)
+            sample = 1.0 if result.ok else 0.0
+            self.success[result.provider] = sample if previous is None else previous + self.alpha * (sample - previous)
+            if result.ok:
+                previous = self.latency.get(result.provider)
+                self.latency[result.provider] = (result.elapsed if previous is None else
+                                                  previous + self.alpha * (result.elapsed - previous))
+
+    def expected(self, expert: Expert):
+        # Expected time in seconds to get an answer from a provider, i.e. its latency divided by its success rate:
+        # 0 if it was never observed, infinite if it never answered
+        provider = self._provider(expert)
+        with self._lock:
+            success = self.success.get(provider)
+            latency = self.latency.get(provider)
+        if success is None:
+            return 0.0
+        if latency is None or success <= 0:
+            return float("inf")
+        return latency / success
+
+    def fastest(self, k: Optional[int] = None, experts: Optional[list] = None):
+        # The k experts with the lowest expected time so far; providers never observed come first so that they get
+        # measured
+        experts = self.experts if experts is None else experts
+        ranked = sorted(experts, key=self.expected)
+        return ranked if k is None else ranked[:k]
+
+    @staticmethod
+    def _run(expert: Expert, source: np.ndarray, destination: np.ndarray, departure: Optional[str], compute_path: bool,
+             simplify: Optional[Callable] = None, started: Optional[list] = None):
+        # started receives the time at which the query leaves the queue of the executor
+        start = time.perf_counter()
+        if started is not None:
+            started.append(start)
+        try:
+            direction = expert.query(source, destination, departure, compute_path, simplify=simplify)
+            return Result(Orchestrator._provider(expert), direction, time.perf_counter() - start)
+        except Exception as e:
+            return Result(Orchestrator._provider(expert), None, time.perf_counter() - start, e)
+
+    def stream(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+               departure: Optional[str] = None, compute_path: Optional[bool] = False, experts: Optional[list] = None,
+               simplify: Optional[Callable] = None):
+        # Query all the experts at once and yield a Result for each of them as soon as it completes
+        # Providers that exceed their timeout are abandoned and yielded as failed; the timeout counts from the start
+        # of the query, not from its submission, since the executor may still be busy with abandoned queries
+        pending = {}
+        for expert in (self.experts if experts is None else experts):
+            started = []
+            future = self.executor.submit(self._run, expert, source, destination, departure, compute_path, simplify,
+                                          started)
+            future.add_done_callback(lambda f: f.cancelled() or self._observe(f.result()))
+            pending[future] = (expert, started, self._timeout(expert))
+
+        try:
+            while pending:
+                deadlines = [started[0] + timeout for _, started, timeout in pending.values()
+                             if timeout is not None and started]
+                queued = any(timeout is not None and not started for _, started, timeout in pending.values())
+                wait_time = max(min(deadlines) - time.perf_counter(), 0) if deadlines else None
+                if queued:
+                    # Check again soon whether the queued queries started
+                    wait_time = QUEUE_POLL if wait_time is None else min(wait_time, QUEUE_POLL)
+
+                done, _ = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    yield future.result()
+
+                now = time.perf_counter()
+                for future, (expert, started, timeout) in list(pending.items()):
+                    if timeout is not None and started and now >= started[0] + timeout:
+                        del pending[future]
+                        future.cancel()
+                        yield Result(self._provider(expert), None, now - started[0],
+                                     TimeoutError("Provider timed out."))
+        finally:
+            # The caller stopped early: abandon the remaining queries
+            for future in pending:
+                future.cancel()
+
+    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+              departure: Optional[str] = None, compute_path: Optional[bool] = False, first: Optional[int] = None,
+              simplify: Optional[Callable] = None):
+        # all-settled mode (first=None): a Result for every expert, in order of completion
+        # first-N mode: return as soon as N experts gave a valid Direction
+        results = []
+        valid = 0
+        stream = self.stream(source, destination, departure, compute_path, simplify=simplify)
+        for result in stream:
+            results.append(result)
+            if result.ok:
+                valid += 1
+                if first is not None and valid >= first:
+                    stream.close()
+                    break
+        return results
+
+    def race(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+             departure: Optional[str] = None, compute_path: Optional[bool] = False, k: Optional[int] = None,
+             experts: Optional[list] = None, simplify: Optional[Callable] = None):
+        # Query the k historically fastest experts (or the given ones) at once and return the Result
+        # of the first valid Direction, the others are abandoned. None if every provider failed
+        stream = self.stream(source, destination, departure, compute_path, self.fastest(k, experts), simplify)
+        for result in stream:
+            if result.ok:
+                stream.close()
+                return result
+        return None
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Optional
+from abstract import Expert
+from batch import Batch
+from direction import Direction
+from ratelimit import TokenBucket
+import json
+import metrics
+import multiprocessing
+import numpy as np
+
+def _parse(cls: type, body: bytes, compute_path: bool, simplify: Optional[Callable] = None):
+    # Runs in a worker process: decode the JSON, parse it, decode the path and simplify it
+    # The path is returned in a shared memory block instead of being pickled
+    direction = cls._parse_request(json.loads(body), compute_path)
+    if direction is None:
+        return None
+    if simplify is not None:
+        direction = simplify(direction)
+
+    name = None
+    points = 0
+    if direction.has_path:
+        coordinates = direction.coordinates
+        points = coordinates.shape[0]
+        if points > 0:
+            block = shared_memory.SharedMemory(create=True, size=coordinates.nbytes)
+            np.ndarray(coordinates.shape, dtype=float, buffer=block.buf)[:] = coordinates
+            name = block.name
+            block.close()
+            # The main process attaches to the block and unlinks it
+            resource_tracker.unregister(block._name, "shared_memory")
+    return (direction.distance, direction.duration, direction.leg_distances, direction.leg_durations,
+            direction.has_path, name, points, direction.path_length)
+
+def _direction(parsed: tuple):
+    # Runs in the main process: rebuild the Direction and release the shared memory block
+    distance, duration, leg_distances, leg_durations, has_path, name, points, path_length = parsed
+    path = np.empty((0, 2), dtype=float) if has_path else None
+    if name is not None:
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            path = np.ndarray((points, 2), dtype=float, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+    return Direction(distance, duration, path, leg_distances, leg_durations, path_length=path_length)
+
+class Pipeline(Batch):
+
+    def __init__(self, expert: Expert, processes: Optional[int] = None, max_workers: int = 8,
+                 rate: Optional[float] = None, bucket: Optional[TokenBucket] = None, dedup: bool = True):
+        # Threads send the requests and a pool of "processes" (by default one per core) decodes the responses,
+        # so that parsing scales across cores instead of holding the GIL of the main interpreter
+        # The workers parse with the class of the expert, so wrappers (e.g., CachedExpert) are not supported
+        if not isinstance(expert, Expert):
+            raise TypeError("Pipeline needs an Expert, not " + type(expert).__name__ + ": use Batch with wrapped experts.")
+        super().__init__(expert, max_workers, rate, bucket, dedup)
+        # Workers are not forked from this process, whose request threads may hold locks: they are started by a fork
+        # server, or spawned where there is none (Windows); either way, scripts that create a Pipeline need an
+        # if __name__ == "__main__" guard
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.processes = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method))
+
+    def _query(self, source: np.ndarray, destination: np.ndarray, departure: Optional[str], compute_path: bool,
+               simplify: Optional[Callable] = None):
+        # simplify runs in the worker process, so it must be picklable (e.g., simplify.Simplifier)
+        if self.bucket is not None:
+            self.bucket.acquire()
+        try:
+            expert = self.expert
+            with metrics.timer("query", expert.name):
+                with metrics.timer("build_request"):
+                    method, url, params, headers = expert._build_request(expert._waypoints(source, destination),
+                                                                         departure, compute_path)
+                body = expert.client.request(method, url, params, headers, raw=True)
+                if body is None:
+                    return None
+                with metrics.timer("parse"):
+                    parsed = self.processes.submit(_parse, type(expert), body, compute_path, simplify).result()
+                    return None if parsed is None else _direction(parsed)
+        except Exception:
+            return None
+
+    def close(self):
+        self.processes.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
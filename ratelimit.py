@@ -0,0 +1,194 @@
+from typing import Optional
+import asyncio
+import threading
+import time
+
+# Approximate requests per second allowed by each API on its standard plan
+DEFAULT_RATES = {
+    "AppleMaps": 25.0,
+    "ArcGIS": 5.0,
+    "BingMaps": 5.0,
+    "GoogleMaps": 50.0,
+    "Here": 10.0,
+    "Mapbox": 5.0,
+    "MapQuest": 5.0,
+    "TomTom": 5.0,
+}
+
+class TokenBucket(object):
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        # rate is the number of tokens (requests) added per second, capacity is the maximum burst
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_provider(cls, provider: str, rate: Optional[float] = None):
+        # Bucket matching the quota of a provider (e.g., "Here", "TomTom")
+        return cls(rate if rate is not None else DEFAULT_RATES.get(provider, 5.0))
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens: float = 1.0):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def _take(self, tokens: float):
+        # Take the tokens and return 0 if they are available, otherwise the seconds to wait for them
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None):
+        # Block until the tokens are available; return False if the timeout expires first
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait_time = self._take(tokens)
+            if wait_time == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+
+    async def aacquire(self, tokens: float = 1.0):
+        # Same as acquire, without blocking the event loop
+        while True:
+            wait_time = self._take(tokens)
+            if wait_time == 0:
+                return True
+            await asyncio.sleep(wait_time)
+
+class AdaptiveBucket(TokenBucket):
+
+    def __init__(self, rate: float, quota: Optional[int] = None, min_rate: float = 0.1, increase: Optional[float] = None,
+                 decrease: float = 0.5, latency_factor: float = 2.0, alpha: float = 0.2, cooldown: float = 1.0):
+        # Token bucket whose rate adapts to the responses (AIMD): it starts at "rate", the known limit, is multiplied
+        # by "decrease" after a 429 and by a smaller factor when the latency grows over "latency_factor" times its
+        # baseline, and grows back by "increase" requests per second after each successful response
+        # The rate decreases at most once every "cooldown" seconds, since concurrent requests are throttled together
+        super().__init__(rate)
+        self.max_rate = self.rate
+        self.min_rate = min_rate
+        self.increase = increase if increase is not None else self.max_rate / 20
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self._decreased = float("-inf")
+        self.latency = None
+        self.baseline = None
+        # Requests per day, None if unlimited; the count restarts at midnight UTC
+        self.quota = quota
+        self.used = 0
+        self._day = int(time.time() // 86400)
+        self._paused_until = 0.0
+
+    @classmethod
+    def for_provider(cls, provider: str, rate: Optional[float] = None, quota: Optional[int] = None):
+        # Daily quotas depend on the plan of each account, so there is none by default
+        return cls(rate if rate is not None else DEFAULT_RATES.get(provider, 5.0), quota)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._decreased >= self.cooldown:
+            self._decreased = now
+            self._set_rate(self.rate * factor)
+
+    def _set_rate(self, rate: float):
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.capacity = max(self.rate, 1.0)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def remaining(self):
+        # Requests left today (inf if unlimited)
+        with self._lock:
+            day = int(time.time() // 86400)
+            if day != self._day:
+                self._day = day
+                self.used = 0
+            return float("inf") if self.quota is None else max(self.quota - self.used, 0)
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None):
+        # False if the daily quota is exhausted or the timeout expires first
+        if self.remaining() < tokens:
+            return False
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        # After a 429 with Retry-After, no request is sent until the provider is ready again
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            if deadline is not None and time.monotonic() + pause > deadline:
+                return False
+            time.sleep(pause)
+        if not super().acquire(tokens, None if deadline is None else max(deadline - time.monotonic(), 0.0)):
+            return False
+        with self._lock:
+            self.used += tokens
+        return True
+
+    async def aacquire(self, tokens: float = 1.0):
+        if self.remaining() < tokens:
+            return False
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await super().aacquire(tokens)
+        with self._lock:
+            self.used += tokens
+        return True
+
+    def throttled(self, retry_after: Optional[float] = None):
+        # A 429 response: multiplicative decrease, and a pause of retry_after seconds if the provider sent one
+        with self._lock:
+            self._refill(time.monotonic())
+            self._decrease(self.decrease)
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def succeeded(self, latency: float):
+        # A successful response: additive increase, unless the latency shows that the provider is slowing down
+        with self._lock:
+            self._refill(time.monotonic())
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+            self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+            if self.latency > self.latency_factor * self.baseline:
+                self._decrease(1 - (1 - self.decrease) / 5)
+                # The baseline follows slowly, so that a lasting change of latency stops reducing the rate
+                self.baseline += self.alpha * self.alpha * (self.latency - self.baseline)
+            else:
+                self._set_rate(self.rate + self.increase)
+
+# One adaptive bucket per provider, shared by all its clients
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter(provider: str):
+    with _limiters_lock:
+        bucket = _limiters.get(provider)
+        if bucket is None:
+            bucket = _limiters[provider] = AdaptiveBucket.for_provider(provider)
+        return bucket
+
+def configure(provider: str, rate: Optional[float] = None, quota: Optional[int] = None):
+    # Set the maximum rate (requests per second) and the daily quota (requests per day) of the plan of a provider,
+    # e.g. configure("Here", quota=1000) for a free tier (None is unlimited); the clients already created use the
+    # new values
+    bucket = limiter(provider)
+    with bucket._lock:
+        if rate is not None:
+            bucket.max_rate = float(rate)
+            bucket.increase = bucket.max_rate / 20
+            bucket._set_rate(bucket.max_rate)
+        bucket.quota = quota
+    return bucket
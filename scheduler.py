@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from batch import Batch, BatchResult
+from ratelimit import limiter
+import numpy as np
+
+def allocate(n: int, rates: np.ndarray, remaining: np.ndarray):
+    # Split n requests proportionally to the rates, without exceeding the remaining quota of any provider
+    rates = np.asarray(rates, dtype=float)
+    remaining = np.asarray(remaining, dtype=float)
+    counts = np.zeros(rates.shape[0], dtype=np.int64)
+    left = n
+    active = (remaining > 0) & (rates > 0)
+    while left > 0 and active.any():
+        share = np.where(active, rates, 0.0)
+        share = left * share / share.sum()
+        base = np.floor(share).astype(np.int64)
+        # Largest remainders get the requests lost to rounding
+        extra = left - base.sum()
+        base[np.argsort(base - share, kind="stable")[:extra]] += 1
+        assigned = np.minimum(base, remaining - counts).astype(np.int64)
+        counts += assigned
+        left -= int(assigned.sum())
+        active &= counts < remaining
+    return counts
+
+class Scheduler(object):
+
+    def __init__(self, experts: list, max_workers: int = 8):
+        # Spread large jobs over several providers, according to their current (adaptive) rate and
+        # the quota they have left today
+        self.experts = list(experts)
+        self.max_workers = max_workers
+
+    def _limiter(self, expert):
+        return getattr(expert.client, "limiter", None) or limiter(expert.name)
+
+    def plan(self, n: int):
+        # Number of pairs assigned to each expert
+        limiters = [self._limiter(expert) for expert in self.experts]
+        return allocate(n, np.array([l.rate for l in limiters]), np.array([l.remaining() for l in limiters]))
+
+    def query(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None,
+              compute_path: Optional[bool] = False, simplify: Optional[Callable] = None):
+        # Query the pairs (sources[i], destinations[i]); return a BatchResult of shape (N,) and the (N,) index of
+        # the expert that answered each pair (-1 for the pairs left out because every quota is exhausted)
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        if sources.shape != destinations.shape:
+            raise ValueError("sources and destinations must have the same shape.")
+        n = sources.shape[0]
+
+        counts = self.plan(n)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        assignment = np.full(n, -1, dtype=np.int64)
+        distance = np.full(n, np.nan, dtype=float)
+        duration = np.full(n, np.nan, dtype=float)
+        directions = np.empty(n, dtype=object)
+
+        def run(i: int):
+            start, end = offsets[i], offsets[i + 1]
+            return Batch(self.experts[i], self.max_workers).query(sources[start:end], destinations[start:end],
+                                                                  departure, compute_path, simplify)
+
+        busy = [i for i in range(len(self.experts)) if counts[i] > 0]
+        with ThreadPoolExecutor(max_workers=max(len(busy), 1)) as executor:
+            for i, result in zip(busy, executor.map(run, busy)):
+                start, end = offsets[i], offsets[i + 1]
+                assignment[start:end] = i
+                distance[start:end] = result.distance
+                duration[start:end] = result.duration
+                directions[start:end] = result.directions
+
+        return BatchResult(distance, duration, np.isnan(distance), directions), assignment
@@ -0,0 +1,105 @@
+from direction import Direction
+from geometry import EARTH_RADIUS, length, segment_lengths
+import numpy as np
+
+def _project(path: np.ndarray):
+    # Equirectangular projection in metres around the mean latitude of the path, accurate at the scale of a tolerance
+    lat = np.radians(path[:, 0])
+    lng = np.radians(path[:, 1])
+    return np.column_stack((EARTH_RADIUS * lng * np.cos(lat.mean()), EARTH_RADIUS * lat))
+
+def douglas_peucker(path: np.ndarray, tolerance: float):
+    # Keep the points farther than "tolerance" metres from the simplified path (Ramer-Douglas-Peucker)
+    # Each pass splits every open segment at its farthest point at once
+    path = np.asarray(path, dtype=float)
+    if path.shape[0] < 3:
+        return path.copy()
+    points = _project(path)
+    keep = np.zeros(path.shape[0], dtype=bool)
+    keep[0] = keep[-1] = True
+    # Points of the segments that still have to be split
+    candidates = np.arange(1, path.shape[0] - 1)
+
+    x, y = points[:, 0].copy(), points[:, 1].copy()
+
+    while candidates.shape[0] > 0:
+        kept = np.flatnonzero(keep)
+        segment = np.searchsorted(kept, candidates) - 1
+        start, end = kept[segment], kept[segment + 1]
+        # Distance of each candidate to the segment [start, end]
+        vx, vy = x[end] - x[start], y[end] - y[start]
+        ox, oy = x[candidates] - x[start], y[candidates] - y[start]
+        norm = vx * vx + vy * vy
+        t = np.clip((ox * vx + oy * vy) / np.where(norm > 0, norm, 1.0), 0.0, 1.0)
+        distances = np.hypot(ox - t * vx, oy - t * vy)
+
+        # Segments within tolerance are final
+        split = np.zeros(kept.shape[0], dtype=bool)
+        split[segment[distances > tolerance]] = True
+        inside = split[segment]
+        candidates, segment, distances = candidates[inside], segment[inside], distances[inside]
+        if candidates.shape[0] == 0:
+            break
+        # Farthest point of each segment (candidates are sorted, so each segment is a contiguous run)
+        starts = np.flatnonzero(np.concatenate(([True], segment[1:] != segment[:-1])))
+        group = np.repeat(np.arange(starts.shape[0]), np.diff(np.append(starts, segment.shape[0])))
+        hits = np.flatnonzero(distances == np.maximum.reduceat(distances, starts)[group])
+        first = hits[np.concatenate(([True], group[hits][1:] != group[hits][:-1]))]
+        keep[candidates[first]] = True
+        candidates = np.delete(candidates, first)
+    return path[keep]
+
+def visvalingam(path: np.ndarray, tolerance: float):
+    # Remove the points whose triangle with their neighbours is smaller than tolerance^2 square metres
+    # (Visvalingam-Whyatt); in each round, every point smaller than its neighbours is removed at once
+    path = np.asarray(path, dtype=float)
+    if path.shape[0] < 3:
+        return path.copy()
+    points = _project(path)
+    index = np.arange(path.shape[0])
+    threshold = tolerance ** 2
+
+    while index.shape[0] > 2:
+        a, b, c = points[index[:-2]], points[index[1:-1]], points[index[2:]]
+        areas = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])) / 2
+        # Local minima are never adjacent, so removing them together does not change the areas of each other
+        padded = np.concatenate(([np.inf], areas, [np.inf]))
+        remove = (areas < threshold) & (areas <= padded[:-2]) & (areas < padded[2:])
+        if not remove.any():
+            break
+        index = np.concatenate((index[:1], index[1:-1][~remove], index[-1:]))
+    return path[index]
+
+def resample(path: np.ndarray, spacing: float):
+    # Points every "spacing" metres along the path, plus its last point
+    path = np.asarray(path, dtype=float)
+    if path.shape[0] < 2:
+        return path.copy()
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths(path))))
+    distances = np.append(np.arange(0.0, cumulative[-1], spacing), cumulative[-1])
+    return np.column_stack((np.interp(distances, cumulative, path[:, 0]), np.interp(distances, cumulative, path[:, 1])))
+
+METHODS = {"douglas_peucker": douglas_peucker, "visvalingam": visvalingam, "resample": resample}
+
+class Simplifier(object):
+
+    def __init__(self, method: str = "douglas_peucker", tolerance: float = 10.0):
+        # method is "douglas_peucker", "visvalingam" (tolerance in metres) or "resample" (spacing of tolerance metres)
+        if method not in METHODS:
+            raise ValueError("Unknown simplification method: " + str(method))
+        self.method = method
+        self.tolerance = tolerance
+
+    @property
+    def key(self):
+        # Identifies the simplification in cache keys
+        return self.method + ":" + repr(float(self.tolerance))
+
+    def __call__(self, direction: Direction):
+        # A Direction with the simplified path; path_length keeps the length of the original path
+        if direction is None or not direction.has_path:
+            return direction
+        path = direction.coordinates
+        return Direction(direction.distance, direction.duration, METHODS[self.method](path, self.tolerance),
+                         direction.leg_distances, direction.leg_durations,
+                         path_length=direction.path_length if direction.path_length is not None else length(path))
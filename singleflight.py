@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+from typing import Callable, Optional
+from cache import cache_key
+import asyncio
+import metrics
+import numpy as np
+import threading
+
+class CoalescedExpert(object):
+
+    def __init__(self, expert, precision: int = 4, bucket: int = 300):
+        # Identical queries in flight at the same time (same provider, coordinates quantized to "precision" decimal
+        # digits, departure bucket of "bucket" seconds and compute_path) share a single request and Direction
+        self.expert = expert
+        self.precision = precision
+        self.bucket = bucket
+        self._inflight = {}
+        self._ainflight = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.expert, name)
+
+    @property
+    def name(self):
+        return self.expert.name
+
+    def key(self, source: np.ndarray, destination: np.ndarray, departure: Optional[str] = None,
+            compute_path: Optional[bool] = False, via: Optional[np.ndarray] = None,
+            simplify: Optional[Callable] = None):
+        return cache_key(self.name, source, destination, departure, compute_path, self.precision, self.bucket, via,
+                         simplify)
+
+    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+              departure: Optional[str] = None, compute_path: Optional[bool] = False,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        key = self.key(source, destination, departure, compute_path, via, simplify)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            # Wait for the query of the first caller
+            metrics.count("coalesced", provider=self.name)
+            return future.result()
+
+        try:
+            future.set_result(self.expert.query(source, destination, departure, compute_path, via, simplify))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return future.result()
+
+    async def aquery(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+                     departure: Optional[str] = None, compute_path: Optional[bool] = False, client=None,
+                     via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        # The queries of the same event loop are coalesced
+        key = self.key(source, destination, departure, compute_path, via, simplify)
+        task = self._ainflight.get(key)
+        if task is not None:
+            metrics.count("coalesced", provider=self.name)
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self.expert.aquery(source, destination, departure, compute_path, client, via,
+                                                        simplify))
+        self._ainflight[key] = task
+        task.add_done_callback(lambda _: self._ainflight.pop(key, None))
+        return await asyncio.shield(task)
@@ -0,0 +1,242 @@
+from cache import departure_bucket
+from direction import Direction, PRECISION
+from geometry import haversine
+from typing import Callable, Optional
+import flexpolyline as fp
+import json
+import metrics
+import numpy as np
+import sqlite3
+import threading
+import time
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320.0
+
+def _box(point: np.ndarray, radius: float):
+    # (min_lat, max_lat, min_lng, max_lng) of the square that contains the circle of "radius" metres around point
+    lat, lng = float(point[0]), float(point[1])
+    dlat = radius / METRES_PER_DEGREE
+    dlng = radius / (METRES_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+class RouteStore(object):
+
+    def __init__(self, path: str = "ospra_routes.sqlite"):
+        # Directions are stored with their path encoded as a single flexpolyline
+        # An R-tree on [source, destination] finds the routes between nearby points
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS routes (
+                id INTEGER PRIMARY KEY, provider TEXT, source_lat REAL, source_lng REAL, destination_lat REAL,
+                destination_lng REAL, departure TEXT, distance REAL, duration REAL, leg_distances TEXT,
+                leg_durations TEXT, polyline TEXT, created REAL);
+            CREATE VIRTUAL TABLE IF NOT EXISTS routes_index USING rtree(
+                id, min_source_lat, max_source_lat, min_source_lng, max_source_lng,
+                min_destination_lat, max_destination_lat, min_destination_lng, max_destination_lng);
+            CREATE INDEX IF NOT EXISTS routes_pair ON routes (
+                provider, source_lat, source_lng, destination_lat, destination_lng);
+        """)
+        self._connection.commit()
+
+    @staticmethod
+    def _row(provider: str, source: np.ndarray, destination: np.ndarray, direction: Direction,
+             departure: Optional[str] = None):
+        coordinates = direction.coordinates
+        return (provider, float(source[0]), float(source[1]), float(destination[0]), float(destination[1]),
+                None if departure is None else str(departure), float(direction.distance), float(direction.duration),
+                json.dumps(direction.leg_distances.tolist()), json.dumps(direction.leg_durations.tolist()),
+                None if coordinates is None else fp.encode_path(coordinates, PRECISION), time.time())
+
+    @staticmethod
+    def _direction(row: tuple):
+        distance, duration, leg_distances, leg_durations, polyline = row
+        # The polyline is decoded on the first access to the path
+        return Direction(distance, duration, polyline, json.loads(leg_distances), json.loads(leg_durations),
+                         fp.decode_path)
+
+    def _insert(self, rows: list):
+        # A route replaces the one stored for the same provider, points and departure
+        cursor = self._connection.cursor()
+        for row in rows:
+            ids = [(i,) for i, in cursor.execute("""
+                SELECT id FROM routes WHERE provider = ? AND source_lat = ? AND source_lng = ? AND destination_lat = ?
+                AND destination_lng = ? AND departure IS ?
+            """, row[:6]).fetchall()]
+            if ids:
+                cursor.executemany("DELETE FROM routes WHERE id = ?", ids)
+                cursor.executemany("DELETE FROM routes_index WHERE id = ?", ids)
+            cursor.execute("INSERT INTO routes VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            # The R-tree stores 32-bit floats, whose boxes are rounded outwards
+            cursor.execute("INSERT INTO routes_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (cursor.lastrowid, row[1], row[1], row[2], row[2], row[3], row[3], row[4], row[4]))
+        self._connection.commit()
+
+    def put(self, provider: str, source: np.ndarray, destination: np.ndarray, direction: Direction,
+            departure: Optional[str] = None):
+        if direction is None:
+            return
+        with self._lock:
+            self._insert([self._row(provider, source, destination, direction, departure)])
+
+    def put_many(self, routes):
+        # Bulk insert of (provider, source, destination, direction) or (..., departure) tuples in one transaction
+        rows = [self._row(*route) for route in routes if route[3] is not None]
+        with self._lock:
+            self._insert(rows)
+        return len(rows)
+
+    def nearby(self, provider: str, source: np.ndarray, destination: np.ndarray, radius: float = 50.0,
+               limit: Optional[int] = None, compute_path: Optional[bool] = False, departure: Optional[str] = None,
+               bucket: Optional[int] = None):
+        # Stored Directions whose source and destination are both within "radius" metres of the given ones,
+        # from the closest (by the sum of the two distances) to the farthest; only those with a path if compute_path
+        # With a bucket in seconds, only the routes whose departure falls in the same bucket as "departure"
+        # (the routes stored without departure if it is None); without, the departure is ignored
+        source = np.asarray(source, dtype=float)
+        destination = np.asarray(destination, dtype=float)
+        conditions = ""
+        if compute_path:
+            conditions += " AND r.polyline IS NOT NULL"
+        if bucket is not None:
+            conditions += " AND r.departure IS NULL" if departure is None else " AND r.departure IS NOT NULL"
+        with self._lock:
+            rows = self._connection.execute("""
+                SELECT r.source_lat, r.source_lng, r.destination_lat, r.destination_lng, r.departure, r.distance,
+                       r.duration, r.leg_distances, r.leg_durations, r.polyline
+                FROM routes_index i JOIN routes r ON r.id = i.id
+                WHERE i.max_source_lat >= ? AND i.min_source_lat <= ? AND i.max_source_lng >= ? AND i.min_source_lng <= ?
+                AND i.max_destination_lat >= ? AND i.min_destination_lat <= ?
+                AND i.max_destination_lng >= ? AND i.min_destination_lng <= ? AND r.provider = ?
+            """ + conditions, _box(source, radius) + _box(destination, radius) + (provider,)).fetchall()
+        if bucket is not None and departure is not None:
+            key = departure_bucket(departure, bucket)
+            rows = [row for row in rows if departure_bucket(row[4], bucket) == key]
+        if len(rows) == 0:
+            return []
+
+        points = np.array([row[:4] for row in rows], dtype=float)
+        offsets = (haversine(points[:, 0], points[:, 1], source[0], source[1]),
+                   haversine(points[:, 2], points[:, 3], destination[0], destination[1]))
+        order = np.argsort(offsets[0] + offsets[1], kind="stable")
+        order = order[(offsets[0][order] <= radius) & (offsets[1][order] <= radius)][:limit]
+        return [self._direction(rows[i][5:]) for i in order]
+
+    def get(self, provider: str, source: np.ndarray, destination: np.ndarray, radius: float = 50.0,
+            compute_path: Optional[bool] = False, departure: Optional[str] = None, bucket: Optional[int] = None):
+        # The closest stored Direction, None if there is none within "radius" metres
+        directions = self.nearby(provider, source, destination, radius, 1, compute_path, departure, bucket)
+        return directions[0] if directions else None
+
+    def samples(self, provider: str):
+        # (K,2) sources, (K,2) destinations, (K,) distances and (K,) durations of the routes of a provider
+        with self._lock:
+            rows = self._connection.execute("""
+                SELECT source_lat, source_lng, destination_lat, destination_lng, distance, duration
+                FROM routes WHERE provider = ? ORDER BY id
+            """, (provider,)).fetchall()
+        rows = np.array(rows, dtype=float).reshape(-1, 6)
+        return rows[:, 0:2], rows[:, 2:4], rows[:, 4], rows[:, 5]
+
+    def dump(self, path: str):
+        # Export every route as JSON Lines
+        with self._lock:
+            rows = self._connection.execute("""
+                SELECT provider, source_lat, source_lng, destination_lat, destination_lng, departure, distance,
+                       duration, leg_distances, leg_durations, polyline FROM routes ORDER BY id
+            """).fetchall()
+        with open(path, "w") as file:
+            for row in rows:
+                file.write(json.dumps({"provider": row[0], "source": [row[1], row[2]], "destination": [row[3], row[4]],
+                                       "departure": row[5], "distance": row[6], "duration": row[7],
+                                       "leg_distances": json.loads(row[8]), "leg_durations": json.loads(row[9]),
+                                       "polyline": row[10]}) + "\n")
+        return len(rows)
+
+    def load(self, path: str):
+        # Import the routes exported by dump
+        rows = []
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    route = json.loads(line)
+                    rows.append((route["provider"], route["source"][0], route["source"][1], route["destination"][0],
+                                 route["destination"][1], route["departure"], route["distance"], route["duration"],
+                                 json.dumps(route["leg_distances"]), json.dumps(route["leg_durations"]),
+                                 route["polyline"], time.time()))
+        with self._lock:
+            self._insert(rows)
+        return len(rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class StoredExpert(object):
+
+    def __init__(self, expert, store: RouteStore, radius: float = 50.0, offline: bool = False,
+                 bucket: Optional[int] = 3600):
+        # Routes between points within "radius" metres of a stored one are read from the store
+        # offline: never query the provider, None if the route is not stored
+        # bucket: a route is read for the departures in the same bucket of seconds as the stored one (and routes
+        # queried without departure only for queries without departure); None if durations do not depend on time
+        self.expert = expert
+        self.store = store
+        self.radius = radius
+        self.offline = offline
+        self.bucket = bucket
+
+    def __getattr__(self, name: str):
+        return getattr(self.expert, name)
+
+    @property
+    def name(self):
+        return self.expert.name
+
+    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+              departure: Optional[str] = None, compute_path: Optional[bool] = False,
+              via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        # Routes through waypoints are not stored, so they are never available offline
+        # The full path is stored, and simplified when it is returned
+        if via is not None and len(via) > 0:
+            if self.offline:
+                return None
+            return self.expert.query(source, destination, departure, compute_path, via, simplify)
+        direction = self.store.get(self.name, source, destination, self.radius, compute_path, departure, self.bucket)
+        if direction is not None:
+            metrics.count("store_hits", provider=self.name)
+        else:
+            metrics.count("store_misses", provider=self.name)
+            if self.offline:
+                return None
+            direction = self.expert.query(source, destination, departure, compute_path)
+            self.store.put(self.name, source, destination, direction, departure)
+        if simplify is not None and direction is not None:
+            direction = simplify(direction)
+        return direction
+
+    async def aquery(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
+                     departure: Optional[str] = None, compute_path: Optional[bool] = False, client=None,
+                     via: Optional[np.ndarray] = None, simplify: Optional[Callable] = None):
+        if via is not None and len(via) > 0:
+            if self.offline:
+                return None
+            return await self.expert.aquery(source, destination, departure, compute_path, client, via, simplify)
+        direction = self.store.get(self.name, source, destination, self.radius, compute_path, departure, self.bucket)
+        if direction is not None:
+            metrics.count("store_hits", provider=self.name)
+        else:
+            metrics.count("store_misses", provider=self.name)
+            if self.offline:
+                return None
+            direction = await self.expert.aquery(source, destination, departure, compute_path, client)
+            self.store.put(self.name, source, destination, direction, departure)
+        if simplify is not None and direction is not None:
+            direction = simplify(direction)
+        return direction
@@ -0,0 +1,107 @@
+from typing import Optional
+import numpy as np
+import json
+import re
+
+# Strings (e.g., "latitude") and punctuation inside the streamed arrays are blanked out, leaving the numbers
+STRING = re.compile(rb'"[^"]*"')
+PUNCTUATION = bytes.maketrans(b"[]{},:", b"      ")
+# Bytes after which a number can't continue
+SEPARATORS = b",]} \t\r\n"
+# Bytes kept between two chunks when looking for a key split across them
+TAIL = 256
+
+class PathStream(object):
+
+    def __init__(self, key: str, size_hint: int = 0):
+        # key is the name of the coordinate arrays (e.g., "points", "coordinates", "paths")
+        # Their numbers are written straight into a float buffer, while the rest of the document is kept as it is
+        self._marker = re.compile(rb'"' + re.escape(key.encode("ascii")) + rb'"\s*:\s*\[')
+        self._skeleton = bytearray()
+        self._pending = bytearray()
+        self._depth = 0
+
+        # Preallocated from the expected size of the body (a number takes at least ~8 bytes), grown if needed
+        self._buffer = np.empty(max(size_hint // 8, 1024), dtype=float)
+        self._size = 0
+        self._start = 0
+        self._arrays = []
+
+    def _append(self, segment: bytes):
+        text = STRING.sub(b" ", segment).translate(PUNCTUATION)
+        if not text.strip():
+            return
+        values = np.fromstring(text, sep=" ")
+        if self._size + values.shape[0] > self._buffer.shape[0]:
+            buffer = np.empty(max(2 * self._buffer.shape[0], self._size + values.shape[0]), dtype=float)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+        self._buffer[self._size:self._size + values.shape[0]] = values
+        self._size += values.shape[0]
+
+    def feed(self, chunk: bytes):
+        self._pending += chunk
+
+        while True:
+            if self._depth == 0:
+                match = self._marker.search(self._pending)
+                if match is None:
+                    cut = max(len(self._pending) - TAIL, 0)
+                    self._skeleton += self._pending[:cut]
+                    del self._pending[:cut]
+                    return
+                # The array is replaced by a placeholder in the skeleton
+                self._skeleton += self._pending[:match.end() - 1] + b'"@@path' + str(len(self._arrays)).encode() + b'@@"'
+                del self._pending[:match.end()]
+                self._depth = 1
+                self._start = self._size
+            else:
+                data = np.frombuffer(bytes(self._pending), dtype=np.uint8)
+                depth = self._depth + np.cumsum((data == ord("[")).astype(np.int64) - (data == ord("]")))
+                closed = np.flatnonzero(depth == 0)
+
+                if closed.size > 0:
+                    end = int(closed[0])
+                    self._append(bytes(self._pending[:end]))
+                    del self._pending[:end + 1]
+                    self._depth = 0
+                    self._arrays.append((self._start, self._size))
+                else:
+                    # Stop at the last separator, a number may continue in the next chunk
+                    cut = max(self._pending.rfind(bytes([c])) for c in SEPARATORS) + 1
+                    if cut > 0:
+                        self._append(bytes(self._pending[:cut]))
+                        self._depth = int(depth[cut - 1])
+                        del self._pending[:cut]
+                    return
+
+    def close(self):
+        # Return the document, with every coordinate array as an (N,2) view of the buffer
+        if self._depth != 0:
+            raise ValueError("Truncated JSON document.")
+        self._skeleton += self._pending
+        self._pending.clear()
+
+        document = json.loads(bytes(self._skeleton))
+        arrays = [self._buffer[start:end].reshape(-1, 2) for start, end in self._arrays]
+
+        return _replace(document, arrays)
+
+def _replace(node, arrays: list):
+    # Put the arrays back in place of their placeholders
+    if isinstance(node, dict):
+        for key, value in node.items():
+            node[key] = _replace(value, arrays)
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            node[i] = _replace(value, arrays)
+    elif isinstance(node, str) and node.startswith("@@path") and node.endswith("@@"):
+        return arrays[int(node[6:-2])]
+    return node
+
+def parse(chunks, key: str, size_hint: Optional[int] = 0):
+    # Parse an iterable of byte chunks (e.g., response.iter_content())
+    stream = PathStream(key, size_hint or 0)
+    for chunk in chunks:
+        stream.feed(chunk)
+    return stream.close()
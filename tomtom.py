@@ -1,22 +1,35 @@
 from pathlib import Path
 from typing import Optional
-from client import Client
+from client import Client, POINT, encode_params, quote_value
+from ratelimit import limiter
 from direction import Direction
-import flexpolyline as fp
 from abstract import Expert
+from matrix import MatrixExpert
 import numpy as np
 import json
 import traceback
 
+def _path(points: list):
+    # points are already (N,2) arrays when the response was streamed
+    return np.concatenate([leg if isinstance(leg, np.ndarray) else
+                           np.array([[node["latitude"], node["longitude"]] for node in leg], dtype=float).reshape(-1, 2)
+                           for leg in points])
+
 class TomTom(Expert):
 
+    max_waypoints = 150
+    path_key = "points"
+
     def __init__(self, key: str):
         self.key = key
         self.base_url = "https://api.tomtom.com/routing/1/calculateRoute/"
-        self.client = Client(base_url=self.base_url)
-    
-    def query(self, source: np.array([], dtype=float), destination: np.array([], dtype=float),
-              departure: Optional[str] = None, compute_path: Optional[bool] = False):
+        self.client = Client(base_url=self.base_url, limiter=limiter(self.name))
+
+        # The parameters that do not depend on the waypoints and departure are encoded once, for each compute_path
+        self._templates = {compute_path: encode_params(self._static_params(compute_path)) for compute_path in (False, True)}
+        self._headers = {"Content-Type": "application/json"}
+
+    def _static_params(self, compute_path: bool):
         # For more information, visit the GET request for calculateRoute at https://developer.tomtom.com/routing-api/documentation/routing/calculate-route
 
         params = {}
@@ -30,19 +43,20 @@ class TomTom(Expert):
         else:
             params["routeRepresentation"] = "summaryOnly"
 
+        return params
+    
+    def _build_request(self, waypoints: np.ndarray, departure: Optional[str] = None,
+                       compute_path: Optional[bool] = False):
         if departure:
             # RFC 3339-format (e.g., 1996-12-19T16:39:57, 1996-12-19T16:39:57-08:00)
-            params["departAt"] = departure
+            query = "departAt=" + quote_value(departure)
         else:
-            params["departAt"] = "now"
-
-        str_source = str(source[0])+","+str(source[1])
-        str_destination = str(destination[0])+","+str(destination[1])
+            query = "departAt=now"
 
-        url = self.base_url+str_source+":"+str_destination+"/json"
+        # source:via0:via1:...:destination
+        url = self.base_url+":".join(POINT % tuple(p) for p in waypoints.tolist())+"/json"
 
-        return self._parse_request(self.client.request_get(base_url=url, params=params,
-                                                           headers={"Content-Type": "application/json"}), compute_path)
+        return "GET", url, query + "&" + self._templates[bool(compute_path)], self._headers
 
     @staticmethod
     def _parse_request(response: dict, compute_path: bool):
@@ -51,20 +65,72 @@ class TomTom(Expert):
             time = response["routes"][0]["summary"]["travelTimeInSeconds"]
             traffic = response["routes"][0]["summary"]["trafficDelayInSeconds"]
             duration = time + traffic
+
+            # There is a leg between each pair of consecutive waypoints
+            legs = response["routes"][0].get("legs", [])
+            leg_distances = [leg["summary"]["lengthInMeters"] for leg in legs] or None
+            leg_durations = [leg["summary"]["travelTimeInSeconds"] + leg["summary"]["trafficDelayInSeconds"] for leg in legs] or None
             
             if compute_path:
-                path = np.array([], dtype = str)
-                for node in response["routes"][0]["legs"][0]["points"]:
-                    lat = node["latitude"]
-                    lng = node["longitude"]
-                    enc_node = fp.encode(np.array([lat, lng], dtype=float), 6)
-                    path = np.append(path, enc_node)
+                # The points of every leg are normalized on the first access to the path
+                points = [leg["points"] for leg in legs]
                 
-                return Direction(distance, duration, path)
+                return Direction(distance, duration, points, leg_distances, leg_durations, _path)
             else:
-                return Direction(distance, duration)
+                return Direction(distance, duration, None, leg_distances, leg_durations)
         except:
-            Path("tomtom.json").write_text(json.dumps(response, indent=4))
+            Path("tomtom.json").write_text(json.dumps(response, indent=4, default=lambda array: array.tolist()))
             print(traceback.format_exc())
             print("Please visit: https://developer.tomtom.com/routing-api/documentation/routing/common-routing-parameters")
-            return None
\ No newline at end of file
+            return None
+
+class TomTomMatrix(MatrixExpert):
+
+    # Synchronous requests
+    max_origins = 200
+    max_destinations = 200
+    max_cells = 200
+
+    def __init__(self, key: str):
+        self.key = key
+        self.base_url = "https://api.tomtom.com/routing/matrix/2"
+        self.client = Client(base_url=self.base_url)
+
+    def _build_request(self, sources: np.ndarray, destinations: np.ndarray, departure: Optional[str] = None):
+        # For more information, visit https://developer.tomtom.com/matrix-routing-v2-api/documentation/synchronous-matrix
+
+        url = self.base_url+"?"+"key="+self.key
+
+        # The body is sent as JSON
+        params = {}
+        params["origins"] = [{"point": {"latitude": float(p[0]), "longitude": float(p[1])}} for p in sources]
+        params["destinations"] = [{"point": {"latitude": float(p[0]), "longitude": float(p[1])}} for p in destinations]
+        params["options"] = {"travelMode": "car", "routeType": "fastest", "traffic": "live"}
+
+        if departure:
+            # RFC 3339-format (e.g., 1996-12-19T16:39:57, 1996-12-19T16:39:57-08:00)
+            params["options"]["departAt"] = departure
+        else:
+            params["options"]["departAt"] = "now"
+
+        return "POST", url, params, {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _parse_request(response: dict, shape: tuple):
+        try:
+            distance = np.full(shape, np.nan, dtype=float)
+            duration = np.full(shape, np.nan, dtype=float)
+
+            # Cells without routeSummary failed
+            for cell in response["data"]:
+                if "routeSummary" in cell:
+                    summary = cell["routeSummary"]
+                    distance[cell["originIndex"], cell["destinationIndex"]] = summary["lengthInMeters"]
+                    duration[cell["originIndex"], cell["destinationIndex"]] = summary["travelTimeInSeconds"] + summary["trafficDelayInSeconds"]
+
+            return distance, duration
+        except:
+            Path("tomtom_matrix.json").write_text(json.dumps(response, indent=4))
+            print(traceback.format_exc())
+            print("Please visit: https://developer.tomtom.com/matrix-routing-v2-api/documentation/synchronous-matrix")
+            return None